@@ -0,0 +1,308 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.Utils.features import (
+    CADENCE, FEATURE_COLUMNS, RAW_COLUMNS, compute_feature_columns, prepare_window, rolling_window_means,
+    window_starts,
+)
+from app.Utils.calibration import DEFAULT_THRESHOLD, load_threshold
+from app.Utils.events import OFF_THRESHOLD, detect_events, iter_timeline_file
+from app.Utils.inference import score_windows
+from app.Utils.ingest import CSV_DTYPES, detect_format, read_chunks
+from app.Utils.model_registry import MODEL_PATH, get_compiled_model, get_model, get_model_version, with_model_version
+
+# Extra data read on both sides of a shard, so samples at its edges see
+# the same Vp std neighbours as in a whole-file run. The std never reaches
+# across a data gap, so one 15-minute window is enough.
+EDGE_MARGIN = pd.Timedelta("15min")
+CACHE_ROW_GROUP = 20_000  # rows per row group of the Parquet input copies (~70 days of 5-minute data)
+
+
+def _range_readable(path: str, fmt: str) -> bool:
+    # Parquet with typed timestamps can be read by time range (row group statistics) as it is
+    return fmt == "parquet" and pa.types.is_timestamp(pq.read_schema(path).field("timestamp").type)
+
+
+def _index_file(task: tuple):
+    """
+    Returns (path, first timestamp, last timestamp, source) of one input file.
+
+    Files that cannot be read by time range (CSV, Feather, Parquet with text
+    timestamps) are parsed once here and copied to `cache_path` as Parquet
+    with typed timestamps, which becomes their `source`; shards then read
+    only their rows from it instead of parsing the whole file again.
+    """
+
+    path, cache_path = task
+    fmt = detect_format(path)
+    copy = not _range_readable(path, fmt)
+    first = last = writer = None
+    try:
+        for chunk in read_chunks(path, fmt):
+            if chunk.empty:
+                continue
+            lo, hi = chunk["timestamp"].min(), chunk["timestamp"].max()
+            first = lo if first is None else min(first, lo)
+            last = hi if last is None else max(last, hi)
+            if copy:
+                table = pa.Table.from_pandas(chunk.astype(CSV_DTYPES), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(cache_path + ".tmp", table.schema)
+                writer.write_table(table.cast(writer.schema), row_group_size=CACHE_ROW_GROUP)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(cache_path + ".tmp", cache_path)
+    return path, first, last, cache_path if writer is not None else path
+
+
+def _file_stamp(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_manifest(files: list, out_dir: str, workers: int = None) -> list:
+    """
+    Returns [(path, first, last, source)] for the input files, where
+    `source` is the file shards read (see _index_file). Files indexed by a
+    previous run into out_dir/manifest.json are taken from it as long as
+    their size and modification time are unchanged; the others are read.
+    """
+
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    cache_dir = os.path.join(out_dir, "inputs")
+    os.makedirs(cache_dir, exist_ok=True)
+    known = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            known = {entry["path"]: entry for entry in json.load(f) if isinstance(entry, dict) and "source" in entry}
+
+    stamps = {path: _file_stamp(path) for path in files}
+    entries = {path: known[path] for path in files
+               if path in known and known[path]["stamp"] == stamps[path] and os.path.exists(known[path]["source"])}
+    stale = [path for path in files if path not in entries]
+    if stale:
+        tasks = [(path, os.path.join(cache_dir, hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+                                     + ".parquet")) for path in stale]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, first, last, source in pool.map(_index_file, tasks):
+                entries[path] = {"path": path, "stamp": stamps[path], "source": source,
+                                 "first": None if first is None else str(first),
+                                 "last": None if last is None else str(last)}
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump([entries[path] for path in files], f, indent=1)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    return [(path, pd.Timestamp(entries[path]["first"]), pd.Timestamp(entries[path]["last"]), entries[path]["source"])
+            for path in files if entries[path]["first"] is not None]
+
+
+def check_run_config(out_dir: str, config: dict, restart: bool = False):
+    """
+    Compares the settings of this run with those recorded in
+    out_dir/run.json by the run that wrote its shards. Shards from other
+    settings (or inputs) would be merged into a wrong timeline, so a
+    mismatch raises ValueError, or with `restart` deletes those shards.
+    Then records `config` for the next run.
+    """
+
+    config_path = os.path.join(out_dir, "run.json")
+    shard_dir = os.path.join(out_dir, "shards")
+    previous = None
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            previous = json.load(f)
+    shards = glob.glob(os.path.join(shard_dir, "*.parquet"))
+
+    if shards and previous != config:
+        changed = sorted(key for key in config if (previous or {}).get(key) != config[key])
+        if not restart:
+            raise ValueError(f"{out_dir} holds shards scored with other settings ({', '.join(changed)} changed); "
+                             f"re-run with --restart to discard them, or use another --out.")
+        print(f"Discarding {len(shards)} shards scored with other settings ({', '.join(changed)} changed)")
+        for path in shards:
+            os.remove(path)
+
+    with open(config_path + ".tmp", "w") as f:
+        json.dump(config, f, indent=1)
+    os.replace(config_path + ".tmp", config_path)
+
+
+def shard_ranges(start, end, shard="7D") -> list:
+    """Splits [start, end) into consecutive [lo, hi) ranges of at most `shard`, aligned to 5 minutes."""
+    start = pd.Timestamp(start).floor(CADENCE)
+    end = pd.Timestamp(end)
+    shard = pd.Timedelta(shard)
+    if shard < CADENCE:
+        raise ValueError("Shards must be at least 5 minutes long.")
+    shard = shard.floor(CADENCE)
+    bounds = list(pd.date_range(start, end, freq=shard))
+    if bounds[-1] < end:
+        bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _read_range(manifest: list, lo, hi) -> pd.DataFrame:
+    """
+    Reads the raw rows with lo <= timestamp < hi from every input overlapping
+    that range. Sources are all Parquet with typed timestamps (see
+    _index_file), so row groups outside the range are skipped.
+    """
+    frames = []
+    for _, first, last, source in manifest:
+        if last < lo or first >= hi:
+            continue
+        table = pq.read_table(source, columns=["timestamp", *RAW_COLUMNS],
+                              filters=[("timestamp", ">=", lo), ("timestamp", "<", hi)])
+        frames.append(table.to_pandas())
+    if not frames:
+        return pd.DataFrame(columns=["timestamp", *RAW_COLUMNS])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _score_shard(task: dict) -> str:
+    """
+    Scores the windows starting in one shard and writes them to the shard's
+    output file. Runs in a worker process; the model is loaded once per
+    process through the registry.
+    """
+
+    lo, hi = pd.Timestamp(task["lo"]), pd.Timestamp(task["hi"])
+    window, stride = pd.Timedelta(task["window"]), pd.Timedelta(task["stride"])
+
+    # Windows starting inside the shard reach `window` past its end
+    raw = _read_range(task["manifest"], lo - EDGE_MARGIN, hi + window + EDGE_MARGIN)
+    if len(raw):
+        samples = compute_feature_columns(prepare_window(raw))
+    else:
+        samples = pd.DataFrame(columns=["timestamp", *FEATURE_COLUMNS])
+
+    # Every shard uses the same grid: origin + k * stride, capped at the last full window
+    origin = pd.Timestamp(task["origin"]).value
+    k = -(-(lo.value - origin) // stride.value)
+    last_start = min(hi.value - 1, pd.Timestamp(task["last_start"]).value)
+    starts = window_starts(origin + k * stride.value, last_start, stride)
+    timeline = rolling_window_means(samples, starts, window)
+
+    model = get_compiled_model(task["model_path"]) if task["backend"] == "compiled" else get_model(task["model_path"])
+    timeline = score_windows(model, timeline, task["threshold"])
+
+    tmp_path = task["out_path"] + ".tmp"
+    timeline.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, task["out_path"])  # a shard only counts as done once fully written
+    return task["out_path"]
+
+
+def backfill(files: list, out_dir: str, start=None, end=None, window="3h", stride="5min", shard="7D",
+             threshold: float = DEFAULT_THRESHOLD, workers: int = None, model_path: str = MODEL_PATH,
+             backend: str = "sklearn", off_threshold: float = OFF_THRESHOLD, min_duration="30min",
+             merge_gap="1h", restart: bool = False) -> str:
+    """
+    Re-scores a historical period across a process pool and writes the
+    merged probability timeline to out_dir/timeline.parquet.
+
+    The period is cut into `shard`-long time ranges; each worker reads only
+    the input files overlapping its range (plus the window length and
+    EDGE_MARGIN around it) and writes out_dir/shards/<start>.parquet. Shards already written
+    by an interrupted run are skipped, so re-running the same command resumes;
+    shards from different settings or changed inputs are refused (see
+    check_run_config) unless `restart` is set.
+    Windows start at `start` + k * `stride` and, as in score_timeline, the
+    last one ends one cadence step after the last sample (or at `end`).
+    The CME events found in the timeline (see detect_events, with
+    `threshold` as the on threshold) go to out_dir/events.csv.
+    """
+
+    os.makedirs(os.path.join(out_dir, "shards"), exist_ok=True)
+    manifest = build_manifest(sorted(files), out_dir, workers)
+    if not manifest:
+        raise ValueError("No readable input rows found.")
+    start = pd.Timestamp(start) if start is not None else min(entry[1] for entry in manifest)
+    end = pd.Timestamp(end) if end is not None else max(entry[2] for entry in manifest) + CADENCE
+    window = pd.Timedelta(window)
+    last_start = max(start, end - window)
+    version = get_model_version(model_path)
+    check_run_config(out_dir, {
+        "window": str(window), "stride": str(pd.Timedelta(stride)), "shard": str(pd.Timedelta(shard)),
+        "origin": str(start.floor(CADENCE)), "last_start": str(last_start),
+        "model_version": version, "backend": backend, "threshold": threshold,
+        "inputs": [[path, *_file_stamp(path)] for path, _, _, _ in manifest],
+    }, restart)
+
+    tasks, outputs = [], []
+    for lo, hi in shard_ranges(start, last_start + pd.Timedelta(1, unit="ns"), shard):
+        out_path = os.path.join(out_dir, "shards", f"{lo:%Y%m%dT%H%M%S}.parquet")
+        outputs.append(out_path)
+        if os.path.exists(out_path):
+            continue
+        tasks.append({
+            "lo": lo, "hi": hi, "origin": start.floor(CADENCE), "last_start": last_start,
+            "window": window, "stride": pd.Timedelta(stride),
+            "threshold": threshold, "model_path": model_path, "backend": backend, "out_path": out_path,
+            "manifest": manifest,
+        })
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for done in pool.map(_score_shard, tasks):
+                print(f"Scored {os.path.basename(done)}")
+
+    # Shards cover disjoint, ordered time ranges, so concatenating them keeps the timeline in order
+    merged_path = os.path.join(out_dir, "timeline.parquet")
+    writer = None
+    try:
+        for path in outputs:
+            table = pq.read_table(path)
+            if writer is None:
+                writer = pq.ParquetWriter(merged_path + ".tmp", with_model_version(table.schema, version))
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(merged_path + ".tmp", merged_path)
+
+    events = detect_events(iter_timeline_file(merged_path), on=threshold, off=min(off_threshold, threshold),
+                           min_duration=min_duration, merge_gap=merge_gap)
+    events.to_csv(os.path.join(out_dir, "events.csv"), index=False)
+    return merged_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score historical SWIS data in parallel.")
+    parser.add_argument("inputs", nargs="+", help="input files or glob patterns (CSV, Parquet, Feather)")
+    parser.add_argument("--out", required=True, help="output directory (re-use it to resume)")
+    parser.add_argument("--start", help="first window start (default: first sample)")
+    parser.add_argument("--end", help="end of the period (default: last sample)")
+    parser.add_argument("--window", default="3h")
+    parser.add_argument("--stride", default="5min")
+    parser.add_argument("--shard", default="7D", help="time range scored per task")
+    parser.add_argument("--threshold", type=float, help="default: the calibrated threshold for the model")
+    parser.add_argument("--off-threshold", type=float, default=OFF_THRESHOLD, help="probability that ends an event")
+    parser.add_argument("--min-duration", default="30min", help="shortest event kept")
+    parser.add_argument("--merge-gap", default="1h", help="events closer than this are merged")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--backend", choices=["sklearn", "compiled"], default="sklearn")
+    parser.add_argument("--restart", action="store_true", help="discard shards scored with other settings")
+    args = parser.parse_args(argv)
+
+    files = sorted({path for pattern in args.inputs for path in (glob.glob(pattern) or [pattern])})
+    threshold = args.threshold if args.threshold is not None else load_threshold(get_model_version(args.model))
+    merged = backfill(files, args.out, start=args.start, end=args.end, window=args.window, stride=args.stride,
+                      shard=args.shard, threshold=threshold, workers=args.workers,
+                      model_path=args.model, backend=args.backend, off_threshold=args.off_threshold,
+                      min_duration=args.min_duration, merge_gap=args.merge_gap, restart=args.restart)
+    print(f"Timeline written to {merged}")
+    print(f"Events written to {os.path.join(args.out, 'events.csv')}")
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.backfill 'data/*.csv' --out backfill_out --workers 8
+    main()
@@ -0,0 +1,114 @@
+import asyncio
+from collections import deque
+import numpy as np
+import pandas as pd
+from app.Utils.features import FEATURE_COLUMNS
+from app.Utils.instrumentation import stage
+from app.Utils.model_registry import resolve_model
+
+
+class QueueFullError(RuntimeError):
+    """Raised by MicroBatcher.submit when `max_queue` rows are already waiting."""
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-window predictions into one model call.
+
+    submit() queues a feature row and waits for its probability. One batch
+    runs at a time (in `executor`), and rows arriving meanwhile form the
+    next one, so batches grow with load. Once requests overlap (the last
+    batch or the queue holds more than one row), a batch is also held up to
+    `max_delay` seconds for more rows, unless `max_batch` are already
+    waiting. A lone request under light load is sent straight away.
+    When `max_queue` rows are waiting, submit() raises QueueFullError
+    instead of queueing more. `model` may be a loader (e.g. get_model),
+    resolved once per batch.
+    """
+
+    def __init__(self, model, max_batch: int = 64, max_delay: float = 0.002, max_queue: int = 1024,
+                 executor=None):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.executor = executor
+        self.batches = self.rows = self.rejected = 0
+        self._last_size = 0
+        self._queue = deque()  # (feature row, future)
+        self._arrived = None   # set while rows are queued
+        self._full = None      # set once a full batch is queued
+        self._task = None
+
+    def __len__(self):
+        return len(self._queue)
+
+    async def submit(self, features) -> float:
+        """Takes one row of the 4 features (array or 1-row DataFrame) and returns its CME probability."""
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"Prediction queue is full ({self.max_queue} waiting); retry shortly.")
+        if self._task is None or self._task.done():
+            self._arrived, self._full = asyncio.Event(), asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+        if isinstance(features, pd.DataFrame) and list(features.columns) != FEATURE_COLUMNS:
+            features = features[FEATURE_COLUMNS]
+        future = asyncio.get_running_loop().create_future()
+        row = features.to_numpy(dtype="float64") if isinstance(features, pd.DataFrame) else np.asarray(features, dtype="float64")
+        self._queue.append((row.reshape(len(FEATURE_COLUMNS)), future))
+        self._arrived.set()
+        if len(self._queue) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def close(self):
+        """Stops the scheduler; requests still queued fail with CancelledError."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while self._queue:
+            self._queue.popleft()[1].cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._arrived.wait()
+            busy = self._last_size > 1 or len(self._queue) > 1
+            if busy and len(self._queue) < self.max_batch and self.max_delay > 0:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            if len(self._queue) < self.max_batch:
+                self._full.clear()
+            if not self._queue:
+                self._arrived.clear()
+            self._last_size = len(batch)
+            batch = [(row, future) for row, future in batch if not future.done()]  # drop cancelled requests
+            if not batch:
+                continue
+
+            matrix = pd.DataFrame(np.vstack([row for row, _ in batch]), columns=FEATURE_COLUMNS)
+            try:
+                probabilities = await loop.run_in_executor(self.executor, self._predict, matrix)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.rows += len(batch)
+            for (_, future), prob in zip(batch, probabilities):
+                if not future.done():
+                    future.set_result(float(prob))
+
+    def _predict(self, matrix: pd.DataFrame) -> np.ndarray:
+        with stage("inference", len(matrix)):
+            return resolve_model(self.model).predict_proba(matrix)[:, 1]
@@ -0,0 +1,267 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+import numpy as np
+import pandas as pd
+
+BENCH_OUTPUT = "bench_results.json"
+
+# (mean, std, lag-1 autocorrelation at 5 minutes) of each column in debug_input.csv
+SWIS_PROFILE = {
+    "proton_density": (2.65, 0.81, 0.72),
+    "proton_speed": (491.0, 32.4, 0.92),
+    "proton_temperature": (76.5, 12.0, 0.77),
+    "alpha_density": (0.046, 0.028, 0.89),
+}
+
+CASES = ["parse_csv", "prepare_window", "extract_features", "extract_features_numpy",
+         "predict_single", "predict_batch", "predict_endpoint"]
+BACKENDS = ["sklearn", "compiled"]
+
+
+def synthetic_swis(n_rows: int, cadence="1min", seed: int = 0, start="2025-06-14 19:25:00") -> pd.DataFrame:
+    """
+    Takes a row count and cadence and returns a seeded synthetic SWIS frame
+    with the columns of debug_input.csv. Each plasma column is an AR(1)
+    series with that file's mean, spread and 5-minute autocorrelation,
+    kept positive. Timestamps are strings, as they come out of a CSV.
+    """
+
+    from scipy.signal import lfilter
+
+    rng = np.random.default_rng(seed)
+    step = pd.Timedelta(cadence).total_seconds()
+    df = pd.DataFrame({
+        "timestamp": pd.date_range(start, periods=n_rows, freq=cadence).strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    for col, (mean, std, phi) in SWIS_PROFILE.items():
+        phi = phi ** (step / 300)  # same decorrelation time at any cadence
+        noise = rng.standard_normal(n_rows) * std * np.sqrt(1 - phi ** 2)
+        noise[0] = rng.standard_normal() * std
+        series = mean + lfilter([1.0], [1.0, -phi], noise)
+        df[col] = np.maximum(series, 0.05 * mean)
+    return df
+
+
+def _setup(case: str, n_rows: int, cadence: str, backend: str):
+    """Builds the inputs of one case outside the timed region and returns the call to time."""
+    from app.Utils.features import compute_feature_columns, extract_features_from_window, prepare_window
+    from app.Utils.model_registry import get_compiled_model, get_model
+
+    if case == "predict_endpoint":
+        os.environ["MODEL_BACKEND"] = backend
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app)
+        body = synthetic_swis(n_rows, cadence).to_csv(index=False).encode()
+
+        def call():
+            main.prediction_cache.clear()  # measure the full path, not a cache hit
+            response = client.post("/predict", files={"file": ("bench.csv", body, "text/csv")})
+            if response.status_code != 200 or "<h2>Error:" in response.text:
+                raise RuntimeError(f"/predict failed: {response.status_code}")
+        return call
+
+    if case in ("predict_single", "predict_batch"):
+        model = get_compiled_model() if backend == "compiled" else get_model()
+        samples = compute_feature_columns(prepare_window(synthetic_swis(n_rows + 2, "5min")))
+        X = samples[["alpha_proton_ratio", "vp_std_15min", "alpha_over_vpstd", "alpha_tp_ratio"]].dropna()
+        X = X.iloc[:1] if case == "predict_single" else X.iloc[:n_rows]
+        return lambda: model.predict_proba(X)
+
+    df = synthetic_swis(n_rows, cadence)
+    if case == "parse_csv":
+        body = df.to_csv(index=False).encode()
+        return lambda: pd.read_csv(BytesIO(body))
+    if case == "prepare_window":
+        return lambda: prepare_window(df.copy(deep=False))
+    if case == "extract_features":
+        return lambda: extract_features_from_window(df.copy(deep=False))
+    if case == "extract_features_numpy":
+        arrays = {col: df[col].to_numpy() for col in df.columns}
+        arrays["timestamp"] = pd.to_datetime(df["timestamp"]).to_numpy()
+        return lambda: extract_features_from_window(arrays)
+    raise ValueError(f"Unknown benchmark case: {case}")
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KiB on Linux
+
+
+def run_case(spec: dict) -> dict:
+    """
+    Runs one benchmark case and returns its result record. `spec` holds
+    case, rows, cadence, backend, min_repeat, max_repeat and budget (s).
+
+    The call is timed at least `min_repeat` times and until `budget` seconds
+    have passed, after one warm-up call. Peak allocations are traced in a
+    separate, untimed call.
+    """
+
+    call = _setup(spec["case"], spec["rows"], spec["cadence"], spec["backend"])
+    call()  # warm-up: imports, lazy model compilation, caches
+
+    times = []
+    started = time.perf_counter()
+    while len(times) < spec["max_repeat"] and (
+            len(times) < spec["min_repeat"] or time.perf_counter() - started < spec["budget"]):
+        t0 = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    call()
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times_ms = np.asarray(times) * 1000
+    return {
+        **{key: spec[key] for key in ("case", "rows", "cadence", "backend")},
+        "repeat": len(times),
+        "mean_ms": float(times_ms.mean()),
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p95_ms": float(np.percentile(times_ms, 95)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+        "rows_per_s": float(spec["rows"] / np.median(times)),
+        "peak_rss_mb": _peak_rss_mb(),
+        "peak_alloc_mb": peak_alloc / 2**20,
+    }
+
+
+def plan(cases: list, sizes: list, cadences: list, backends: list) -> list:
+    """Expands the requested cases into (case, rows, cadence, backend) runs, skipping combinations that don't apply."""
+    runs = []
+    for case in cases:
+        case_backends = backends if case.startswith("predict") else [None]
+        case_sizes = [1] if case == "predict_single" else sizes
+        # Inference is cadence-independent; /predict only accepts ~5-minute data
+        case_cadences = ["5min"] if case.startswith("predict") else cadences
+        for backend in case_backends:
+            for cadence in case_cadences:
+                for rows in case_sizes:
+                    runs.append({"case": case, "rows": rows, "cadence": cadence, "backend": backend})
+    return runs
+
+
+def run_benchmarks(runs: list, min_repeat: int = 3, max_repeat: int = 200, budget: float = 2.0,
+                   verbose: bool = True) -> dict:
+    """
+    Runs each benchmark in a fresh process, so peak RSS belongs to that case
+    alone, and returns {"meta": ..., "results": [...]}.
+    """
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for run in runs:
+        spec = {**run, "min_repeat": min_repeat, "max_repeat": max_repeat, "budget": budget}
+        with ctx.Pool(1) as pool:
+            result = pool.apply(run_case, (spec,))
+        results.append(result)
+        if verbose:
+            print(f"{_key_label(result):<48} p50 {result['p50_ms']:10.3f} ms  p95 {result['p95_ms']:10.3f} ms  "
+                  f"{result['rows_per_s']:14,.0f} rows/s  peak RSS {result['peak_rss_mb']:8.1f} MB")
+    return {"meta": environment(), "results": results}
+
+
+def environment() -> dict:
+    """Returns the library versions and machine details a result set was measured with."""
+    import sklearn
+    import xgboost
+
+    return {
+        "created": pd.Timestamp.now(tz="UTC").isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "xgboost": xgboost.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _key(result: dict) -> tuple:
+    return result["case"], result["rows"], result["cadence"], result["backend"]
+
+
+def _key_label(result: dict) -> str:
+    backend = f"[{result['backend']}]" if result["backend"] else ""
+    return f"{result['case']}{backend} {result['rows']:,} @ {result['cadence']}"
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.10) -> list:
+    """
+    Matches two result sets run by run and returns a row per shared run with
+    the p50 latency ratio (current / baseline). A run whose ratio exceeds
+    1 + `tolerance` is flagged as a regression.
+    """
+
+    base = {_key(result): result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = base.get(_key(result))
+        if old is None:
+            continue
+        ratio = result["p50_ms"] / old["p50_ms"]
+        rows.append({
+            "run": _key_label(result),
+            "baseline_p50_ms": old["p50_ms"],
+            "p50_ms": result["p50_ms"],
+            "ratio": ratio,
+            "peak_rss_ratio": result["peak_rss_mb"] / old["peak_rss_mb"],
+            "regression": ratio > 1 + tolerance,
+        })
+    return rows
+
+
+def _split(value: str, cast=str) -> list:
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark feature extraction and inference.")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"comma-separated subset of {CASES}")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="row counts, up to 10000000")
+    parser.add_argument("--cadences", default="1min,5min")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--min-repeat", type=int, default=3)
+    parser.add_argument("--max-repeat", type=int, default=200)
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds of timed calls per run")
+    parser.add_argument("--out", default=BENCH_OUTPUT, help="JSON results file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p50 slowdown before failing")
+    args = parser.parse_args(argv)
+
+    unknown = set(_split(args.cases)) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    runs = plan(_split(args.cases), _split(args.sizes, int), _split(args.cadences), _split(args.backends))
+    report = run_benchmarks(runs, args.min_repeat, args.max_repeat, args.budget)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(report, json.load(f), args.tolerance)
+        for row in rows:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['run']:<48} {row['baseline_p50_ms']:10.3f} -> {row['p50_ms']:10.3f} ms  "
+                  f"x{row['ratio']:.2f}{flag}")
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.benchmark --sizes 1000,100000 --out bench_results.json --baseline old.json
+    main()
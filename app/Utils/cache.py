@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import hashlib
+import sys
+import threading
+import time
+
+
+def file_fingerprint(path: str) -> str:
+    """Returns a short content hash of a file, used to tag cache keys with the model version."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def estimate_nbytes(value) -> int:
+    """Returns roughly how much memory a cached value holds: DataFrames, arrays and containers of them."""
+    if hasattr(value, "memory_usage"):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache with a per-entry time-to-live, for prediction results.
+
+    Keys come from make_key: a hash of the raw uploaded bytes plus the model
+    version and decision threshold, so a new model or threshold never
+    serves stale results. Safe to share between threads.
+
+    With `max_bytes`, entries are also evicted once their estimated total
+    size (see estimate_nbytes) exceeds it, and a single larger value is
+    not cached at all.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600.0, max_bytes: int = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key -> (expiry, value, size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(contents: bytes, model_version: str, threshold: float) -> str:
+        return f"{hashlib.sha256(contents).hexdigest()}:{model_version}:{threshold!r}"
+
+    def get(self, key: str):
+        """Returns the cached value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.nbytes -= entry[2]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value):
+        size = 0 if self.max_bytes is None else estimate_nbytes(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value, size)
+            self.nbytes += size
+            while len(self._entries) > self.maxsize or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+                self.nbytes -= self._entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.Utils.feature_store import FeatureStore
+from app.Utils.features import parse_timestamps
+from app.Utils.model_registry import (
+    MODEL_PATH, get_compiled_model, get_model, get_model_version, timeline_model_version, with_model_version,
+)
+
+DEFAULT_THRESHOLD = 0.45
+THRESHOLD_PATH = os.getenv("CME_THRESHOLD_FILE", "app/model/threshold.json")
+CURVE_COLUMNS = ["threshold", "tp", "fp", "fn", "tn", "precision", "recall", "f1"]
+
+
+def load_threshold(model_version: str = None, path: str = THRESHOLD_PATH, default: float = DEFAULT_THRESHOLD) -> float:
+    """
+    Returns the decision threshold chosen by the last calibration run (see
+    write_threshold), or `default` when there is none. A file calibrated
+    for another model version is ignored.
+    """
+    try:
+        with open(path) as f:
+            chosen = json.load(f)
+    except FileNotFoundError:
+        return default
+    if model_version is not None and chosen.get("model_version") not in (None, model_version):
+        print(f"Ignoring {path}: calibrated for model {chosen.get('model_version')}, not {model_version}")
+        return default
+    return float(chosen["threshold"])
+
+
+def write_threshold(recommendation: dict, path: str = THRESHOLD_PATH):
+    """Saves a recommendation from recommend_threshold (plus any provenance keys) for load_threshold."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(recommendation, f, indent=1)
+    os.replace(tmp, path)
+
+
+def threshold_sweep(labels, probabilities, thresholds=None) -> pd.DataFrame:
+    """
+    Takes binary labels and predicted probabilities and returns the
+    confusion counts, precision, recall and F1 for every threshold at once
+    (a window is called a CME when its probability >= threshold).
+
+    The probabilities are sorted once; the counts above each threshold
+    then come from cumulative sums, so the whole curve costs O(N log N).
+    By default every distinct probability is a threshold, which gives the
+    exact curve; pass `thresholds` (e.g. a grid of thousands) to evaluate
+    those instead, by binary search into the sorted scores. Rows with a NaN
+    probability are ignored. Precision is 1 where nothing is called a CME.
+    """
+
+    labels = np.asarray(labels, dtype=bool)
+    probabilities = np.asarray(probabilities, dtype="float64")
+    keep = ~np.isnan(probabilities)
+    labels, probabilities = labels[keep], probabilities[keep]
+
+    order = np.argsort(-probabilities, kind="stable")
+    scores = probabilities[order]
+    tp = np.r_[0, np.cumsum(labels[order])]
+    called = np.arange(len(scores) + 1)
+
+    if thresholds is None:
+        # Calling everything at or above a score: the last position of each distinct score
+        k = np.flatnonzero(np.r_[scores[1:] != scores[:-1], True]) + 1
+        thresholds = scores[k - 1]
+    else:
+        thresholds = np.asarray(thresholds, dtype="float64")
+        k = np.searchsorted(-scores, -thresholds, side="right")
+
+    tp, called = tp[k], called[k]
+    fp = called - tp
+    positives = int(labels.sum())
+    fn = positives - tp
+    tn = len(scores) - positives - fp
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.where(called > 0, tp / called, 1.0)
+        recall = tp / positives if positives else np.full(len(k), np.nan)
+        f1 = np.where(tp > 0, 2 * tp / (2 * tp + fp + fn), 0.0)
+
+    curve = pd.DataFrame({"threshold": thresholds, "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+                          "precision": precision, "recall": recall, "f1": f1})
+    return curve.sort_values("threshold", kind="stable", ignore_index=True)
+
+
+def recommend_threshold(curve: pd.DataFrame, min_recall: float = 0.0) -> dict:
+    """
+    Picks the threshold with the best F1 among those whose recall is at
+    least `min_recall` (1.0: miss no labelled CME). Ties go to the higher
+    threshold. Returns its row of the curve as a dict.
+    """
+    eligible = curve[curve["recall"] >= min_recall]
+    if eligible.empty:
+        raise ValueError(f"No threshold reaches a recall of {min_recall}.")
+    best = eligible.iloc[::-1]["f1"].idxmax()  # reversed, so the first maximum is the highest threshold
+    row = curve.loc[best]
+    return {col: (float(row[col]) if col in ("threshold", "precision", "recall", "f1") else int(row[col]))
+            for col in CURVE_COLUMNS}
+
+
+def label_windows(timeline: pd.DataFrame, catalog, before="1D", after="2D") -> np.ndarray:
+    """
+    Takes a timeline (window_start, window_end) and catalog event times and
+    labels each window a CME when its midpoint lies within [time - before,
+    time + after] of a catalog event: the T-1 to T+2 days span the model
+    was trained on.
+    """
+    times = np.sort(parse_timestamps(pd.Series(catalog)).dropna().to_numpy(dtype="datetime64[ns]").view("int64"))
+    start = timeline["window_start"].to_numpy(dtype="datetime64[ns]").view("int64")
+    end = timeline["window_end"].to_numpy(dtype="datetime64[ns]").view("int64")
+    mid = start + (end - start) // 2
+    before, after = pd.Timedelta(before).value, pd.Timedelta(after).value
+    # A catalog time c covers mid when mid - after <= c <= mid + before
+    return np.searchsorted(times, mid + before, side="right") > np.searchsorted(times, mid - after, side="left")
+
+
+def score_store(root: str, model, out_path: str, window="3h", stride="5min", model_version: str = None) -> pd.DataFrame:
+    """
+    Scores every window of a feature store once and writes the timeline
+    (window_start, window_end, probability) to `out_path`, tagged with
+    `model_version` when given; later calls with the same `out_path` read
+    it back instead of scoring again.
+    """
+    if os.path.exists(out_path):
+        return pq.read_table(out_path).to_pandas()
+
+    frames = [timeline[["window_start", "window_end", "probability"]]
+              for timeline in FeatureStore(root).score(model, window=window, stride=stride)]
+    timeline = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        columns=["window_start", "window_end", "probability"])
+    table = pa.Table.from_pandas(timeline, preserve_index=False)
+    if model_version is not None:
+        table = table.cast(with_model_version(table.schema, model_version))
+    pq.write_table(table, out_path + ".tmp")
+    os.replace(out_path + ".tmp", out_path)
+    return timeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep decision thresholds over labelled windows and pick one.")
+    parser.add_argument("source", help="feature store directory, or a scored timeline Parquet file (e.g. a backfill's)")
+    parser.add_argument("--catalog", required=True, help="CSV of catalog CME times (first column) used as labels")
+    parser.add_argument("--out", default="calibration_out", help="directory for scores, curve and recommendation")
+    parser.add_argument("--window", default="3h")
+    parser.add_argument("--stride", default="5min")
+    parser.add_argument("--before", default="1D", help="windows this long before a catalog time count as CME")
+    parser.add_argument("--after", default="2D", help="windows this long after a catalog time count as CME")
+    parser.add_argument("--grid", type=int, default=0, help="evaluate N evenly spaced thresholds (default: every distinct score)")
+    parser.add_argument("--min-recall", type=float, default=0.0, help="only recommend thresholds with this recall")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--model-version", help="version of the model that scored a timeline source "
+                                                "(default: the one recorded in the file)")
+    parser.add_argument("--backend", choices=["sklearn", "compiled"], default="sklearn")
+    parser.add_argument("--apply", action="store_true", help=f"write the recommendation to {THRESHOLD_PATH}")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    if os.path.isdir(args.source):
+        version = get_model_version(args.model)
+        model = get_compiled_model(args.model) if args.backend == "compiled" else get_model(args.model)
+        scores_path = os.path.join(args.out, f"scores_{version}_{args.window}_{args.stride}.parquet")
+        timeline = score_store(args.source, model, scores_path, args.window, args.stride, version)
+    else:
+        # The threshold belongs to whichever model scored the file, not to the current one
+        version = args.model_version or timeline_model_version(args.source)
+        if version is None:
+            parser.error(f"{args.source} does not record the model that scored it; pass --model-version.")
+        timeline = pq.read_table(args.source, columns=["window_start", "window_end", "probability"]).to_pandas()
+
+    labels = label_windows(timeline, pd.read_csv(args.catalog).iloc[:, 0], args.before, args.after)
+    curve = threshold_sweep(labels, timeline["probability"],
+                            np.linspace(0, 1, args.grid) if args.grid else None)
+    curve.to_csv(os.path.join(args.out, "curve.csv"), index=False)
+
+    recommendation = recommend_threshold(curve, args.min_recall)
+    recommendation.update({"model_version": version, "min_recall": args.min_recall, "window": args.window,
+                           "n_windows": recommendation["tp"] + recommendation["fp"] + recommendation["fn"] + recommendation["tn"],
+                           "n_positive": recommendation["tp"] + recommendation["fn"]})
+    write_threshold(recommendation, os.path.join(args.out, "threshold.json"))
+    print(json.dumps(recommendation, indent=1))
+    if args.apply:
+        write_threshold(recommendation, THRESHOLD_PATH)
+        print(f"Threshold written to {THRESHOLD_PATH}; restart the service to use it")
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.calibration feature_store/ --catalog cactus_halo.csv --min-recall 1.0 --apply
+    main()
@@ -0,0 +1,209 @@
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+COMPILED_MODEL_PATH = "app/model/cme_model_compiled.npz"
+
+
+def _flatten_sklearn_forest(forest) -> dict:
+    """Concatenates the node tables of a fitted sklearn forest into flat arrays."""
+    feature, threshold, left, right, missing_left, value, roots = [], [], [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        ids = np.arange(n) + offset
+
+        proba = tree.value[:, 0, :]
+        proba = proba / proba.sum(axis=1, keepdims=True)
+
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+        left.append(np.where(is_leaf, ids, tree.children_left + offset))
+        right.append(np.where(is_leaf, ids, tree.children_right + offset))
+        missing = getattr(tree, "missing_go_to_left", None)
+        missing_left.append(np.zeros(n, dtype=bool) if missing is None else missing.astype(bool))
+        value.append(proba[:, 1])
+        roots.append(offset)
+        offset += n
+
+    return {
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "missing_left": np.concatenate(missing_left),
+        "value": np.concatenate(value).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+
+
+def _flatten_xgboost(classifier) -> dict:
+    """Concatenates the trees of a fitted binary:logistic XGBClassifier into flat arrays."""
+    booster = classifier.get_booster()
+    raw = json.loads(booster.save_raw("json"))
+    learner = raw["learner"]
+    if learner["objective"]["name"] != "binary:logistic":
+        raise ValueError(f"Unsupported XGBoost objective: {learner['objective']['name']}")
+
+    feature, threshold, left, right, missing_left, value, roots = [], [], [], [], [], [], []
+    offset = 0
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+        children_left = np.asarray(tree["left_children"])
+        n = len(children_left)
+        is_leaf = children_left == -1
+        ids = np.arange(n) + offset
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+
+        feature.append(np.where(is_leaf, 0, tree["split_indices"]))
+        threshold.append(np.where(is_leaf, 0.0, conditions))
+        left.append(np.where(is_leaf, ids, children_left + offset))
+        right.append(np.where(is_leaf, ids, np.asarray(tree["right_children"]) + offset))
+        missing_left.append(np.asarray(tree["default_left"], dtype=bool))
+        value.append(np.where(is_leaf, conditions, 0.0))  # a leaf's split_condition is its value
+        roots.append(offset)
+        offset += n
+
+    base_score = float(learner["learner_model_param"]["base_score"].strip("[]"))
+    return {
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float32),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "missing_left": np.concatenate(missing_left),
+        "value": np.concatenate(value).astype(np.float32),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "base_margin": np.asarray(np.log(base_score / (1 - base_score))),
+    }
+
+
+def _traverse(tables: dict, X: np.ndarray, strict: bool) -> np.ndarray:
+    """
+    Walks every tree for every row at once, one depth level per step.
+    Returns the (n_rows, n_trees) leaf values. Leaves point to themselves,
+    so rows that reach a leaf early stay put.
+    """
+    nodes = np.broadcast_to(tables["roots"], (len(X), len(tables["roots"]))).copy()
+    rows = np.arange(len(X))[:, None]
+    has_missing = np.isnan(X).any()
+    for _ in range(int(tables["max_depth"])):
+        x = X[rows, tables["feature"][nodes]]
+        threshold = tables["threshold"][nodes]
+        go_left = (x < threshold) if strict else (x <= threshold)
+        if has_missing:
+            go_left = np.where(np.isnan(x), tables["missing_left"][nodes], go_left)
+        nodes = np.where(go_left, tables["left"][nodes], tables["right"][nodes])
+    return tables["value"][nodes]
+
+
+def _max_depth(tables: dict) -> int:
+    depth = np.zeros(len(tables["feature"]), dtype=np.int64)
+    for root in tables["roots"]:
+        stack = [(int(root), 0)]
+        while stack:
+            node, d = stack.pop()
+            depth[node] = d
+            if tables["left"][node] != node:
+                stack.append((int(tables["left"][node]), d + 1))
+                stack.append((int(tables["right"][node]), d + 1))
+    return int(depth.max())
+
+
+class CompiledEnsemble:
+    """
+    NumPy-only predictor equivalent to the soft-voting RF + XGBoost + LogReg
+    ensemble: flattened tree tables for the two forests and a dot product for
+    the logistic regression. Needs neither sklearn nor xgboost at predict time.
+    """
+
+    feature_names = ["alpha_proton_ratio", "vp_std_15min", "alpha_over_vpstd", "alpha_tp_ratio"]
+
+    def __init__(self, arrays: dict):
+        self.arrays = arrays
+        self.rf = {k[3:]: v for k, v in arrays.items() if k.startswith("rf_")}
+        self.xgb = {k[4:]: v for k, v in arrays.items() if k.startswith("xgb_")}
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Returns the (n, 2) class probabilities, like VotingClassifier.predict_proba."""
+        if isinstance(X, pd.DataFrame) and list(X.columns) != self.feature_names:
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        # Both tree libraries compare features in single precision
+        X32 = X.astype(np.float32)
+
+        rf = _traverse(self.rf, X32, strict=False).mean(axis=1)
+        xgb = 1.0 / (1.0 + np.exp(-(self.xgb["base_margin"] + _traverse(self.xgb, X32, strict=True).sum(axis=1))))
+        lr = 1.0 / (1.0 + np.exp(-(X @ self.arrays["lr_coef"] + self.arrays["lr_intercept"])))
+
+        proba = np.average(np.vstack([rf, xgb, lr]), axis=0, weights=self.arrays["weights"])
+        return np.column_stack([1.0 - proba, proba])
+
+    def save(self, path: str = COMPILED_MODEL_PATH):
+        np.savez(path, **self.arrays)
+
+    @classmethod
+    def load(cls, path: str = COMPILED_MODEL_PATH) -> "CompiledEnsemble":
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def save_dir(self, directory: str):
+        """
+        Writes each array to its own .npy file in `directory`. Files are
+        replaced, not rewritten, so processes that have the old ones mapped
+        keep reading consistent arrays.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self.arrays.items():
+            tmp = os.path.join(directory, f".{name}.npy.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, os.path.join(directory, f"{name}.npy"))
+
+    @classmethod
+    def load_dir(cls, directory: str, mmap_mode: str = "r") -> "CompiledEnsemble":
+        """
+        Loads arrays written by save_dir. With `mmap_mode` "r" they are mapped
+        read-only rather than copied, so every process that loads the same
+        directory shares one copy of the tree tables in the page cache.
+        """
+        names = sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".npy"))
+        return cls({name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in names})
+
+
+def compile_ensemble(model) -> CompiledEnsemble:
+    """
+    Takes the fitted soft-voting VotingClassifier (rf, xgb, lr) and exports
+    it to a CompiledEnsemble.
+    """
+    if getattr(model, "voting", None) != "soft" or list(model.named_estimators_) != ["rf", "xgb", "lr"]:
+        raise ValueError("Expected a soft-voting ensemble of rf, xgb and lr estimators.")
+    if list(model.classes_) != [0, 1]:
+        raise ValueError("Expected a binary classifier with classes [0, 1].")
+
+    rf = _flatten_sklearn_forest(model.named_estimators_["rf"])
+    xgb = _flatten_xgboost(model.named_estimators_["xgb"])
+    rf["max_depth"] = np.asarray(_max_depth(rf))
+    xgb["max_depth"] = np.asarray(_max_depth(xgb))
+    lr = model.named_estimators_["lr"]
+
+    arrays = {f"rf_{k}": v for k, v in rf.items()}
+    arrays.update({f"xgb_{k}": v for k, v in xgb.items()})
+    arrays["lr_coef"] = lr.coef_[0].astype(np.float64)
+    arrays["lr_intercept"] = np.asarray(lr.intercept_[0], dtype=np.float64)
+    arrays["weights"] = np.ones(3) if model.weights is None else np.asarray(model.weights, dtype=np.float64)
+    return CompiledEnsemble(arrays)
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.compiled_model [model.joblib] [out.npz]
+    import joblib
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else "app/model/cme_model.joblib"
+    out_path = sys.argv[2] if len(sys.argv) > 2 else COMPILED_MODEL_PATH
+    compile_ensemble(joblib.load(model_path)).save(out_path)
+    print(f"Compiled {model_path} -> {out_path}")
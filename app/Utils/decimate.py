@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from app.Utils.features import MAX_NEIGHBOUR_GAP_NS
+
+PIXEL_BUDGET = 1500  # buckets per trace, about one per horizontal pixel; each keeps its min and max
+
+
+def minmax_indices(y: np.ndarray, n_buckets: int = PIXEL_BUDGET) -> np.ndarray:
+    """
+    Splits `y` into `n_buckets` equal-count buckets and returns the sorted
+    row indices of each bucket's min and max, plus the first and last row.
+    A line through these points covers the same vertical extent as one
+    through every point, at any zoom level where a bucket is at most one
+    pixel wide. NaNs are skipped; an all-NaN bucket keeps its first row.
+    """
+
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+
+    size = -(-n // n_buckets)
+    full = n // size
+    y = np.asarray(y, dtype="float64")
+    missing = np.isnan(y)
+    lows = np.where(missing, np.inf, y)
+    highs = np.where(missing, -np.inf, y)
+
+    offsets = np.arange(full) * size
+    picks = [offsets + lows[:full * size].reshape(full, size).argmin(axis=1),
+             offsets + highs[:full * size].reshape(full, size).argmax(axis=1),
+             [0, n - 1]]
+    if full * size < n:
+        tail = full * size
+        picks.append([tail + lows[tail:].argmin(), tail + highs[tail:].argmax()])
+    return np.unique(np.concatenate(picks))
+
+
+def decimate_frame(df: pd.DataFrame, columns: list, n_buckets: int = PIXEL_BUDGET, start=None, end=None,
+                   max_gap: int = MAX_NEIGHBOUR_GAP_NS) -> pd.DataFrame:
+    """
+    Takes a time-sorted frame with a `timestamp` column and returns the rows
+    between `start` and `end` (inclusive) to plot for `columns`, at most
+    about 2 * `n_buckets` per column.
+
+    The rows kept are the union of every column's min/max rows, so the
+    traces share their x values. Consecutive kept rows with a step longer
+    than `max_gap` nanoseconds between them get a NaN row in between, so
+    Plotly breaks the line there instead of drawing across an outage; at
+    most one per kept row, so gappy data stays within the budget.
+    """
+
+    ts = df["timestamp"].to_numpy(dtype="datetime64[ns]").view("int64")
+    lo = 0 if start is None else np.searchsorted(ts, pd.Timestamp(start).value, side="left")
+    hi = len(ts) if end is None else np.searchsorted(ts, pd.Timestamp(end).value, side="right")
+    ts = ts[lo:hi]
+    values = df[columns].to_numpy(dtype="float64")[lo:hi]
+    if len(ts) == 0:
+        return pd.DataFrame(columns=["timestamp", *columns])
+
+    keep = np.unique(np.concatenate([minmax_indices(values[:, i], n_buckets) for i in range(len(columns))]))
+
+    # Gap steps before each row; consecutive kept rows with one in between get a NaN row
+    gaps_before = np.r_[0, np.cumsum(np.diff(ts) > max_gap)]
+    breaks = np.flatnonzero(gaps_before[keep[1:]] > gaps_before[keep[:-1]]) + 1
+    ts_out = np.insert(ts[keep], breaks, ts[keep][breaks - 1] + 1)
+    values_out = np.insert(values[keep], breaks, np.nan, axis=0)
+
+    out = pd.DataFrame(values_out, columns=columns)
+    timestamps = pd.DatetimeIndex(ts_out.view("datetime64[ns]"))
+    tz = getattr(df["timestamp"].dt, "tz", None)
+    out.insert(0, "timestamp", timestamps if tz is None else timestamps.tz_localize("UTC").tz_convert(tz))
+    return out
@@ -0,0 +1,207 @@
+import argparse
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+import numpy as np
+import pandas as pd
+from app.Utils.features import FEATURE_COLUMNS
+from app.Utils.ingest import detect_format, iter_feature_samples, iter_resampled_chunks, read_chunks
+
+MONITORED_COLUMNS = ["Np", "Vp", "Tp", "Alpha", *FEATURE_COLUMNS]
+REFERENCE_PATH = os.getenv("CME_DRIFT_REFERENCE", "app/model/drift_reference.json")
+DRIFT_PSI = 0.25       # population stability index above which a column counts as drifted
+MIN_SAMPLES = 30       # fewer samples than this give no scores
+_EPS = 1e-4            # floor for bin proportions in the PSI
+
+
+def _finite(value: float):
+    return value if math.isfinite(value) else None
+
+
+class DriftMonitor:
+    """
+    Streaming sketch of the raw plasma columns and the 4 features, compared
+    against a reference profile (see build_reference).
+
+    Per column it keeps the count, the number of missing (NaN or infinite)
+    values, a running mean and variance (Welford, merged per batch with
+    Chan's formula) and a histogram over the reference's equal-mass bins.
+    Updating costs O(1) per sample and memory does not grow with the
+    stream, so scores never need another pass over the data. Without a
+    reference only the moments are kept. Safe to update from several threads.
+    """
+
+    def __init__(self, reference: dict = None, columns=MONITORED_COLUMNS):
+        self.reference = reference
+        self.columns = list(columns)
+        self.edges = [np.asarray(reference[col]["edges"], dtype="float64") if reference else np.empty(0)
+                      for col in self.columns]
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forgets everything seen so far, e.g. to score a new period."""
+        with self._lock:
+            k = len(self.columns)
+            self.n = np.zeros(k, dtype="int64")
+            self.missing = np.zeros(k, dtype="int64")
+            self.mean = np.zeros(k)
+            self.m2 = np.zeros(k)
+            self.counts = [np.zeros(len(edges) + 1, dtype="int64") for edges in self.edges]
+
+    def update(self, samples: pd.DataFrame):
+        """Adds a frame of per-sample rows (see compute_feature_columns); missing columns count as missing."""
+        values = samples.reindex(columns=self.columns).to_numpy(dtype="float64")
+        finite = np.isfinite(values)
+        with self._lock:
+            for j in range(len(self.columns)):
+                x = values[finite[:, j], j]
+                self.missing[j] += len(values) - len(x)
+                if not len(x):
+                    continue
+                n_b, mean_b = len(x), x.mean()
+                n = self.n[j] + n_b
+                delta = mean_b - self.mean[j]
+                self.m2[j] += ((x - mean_b) ** 2).sum() + delta ** 2 * self.n[j] * n_b / n
+                self.mean[j] += delta * n_b / n
+                self.n[j] = n
+                self.counts[j] += np.bincount(np.searchsorted(self.edges[j], x, side="right"),
+                                              minlength=len(self.counts[j]))
+
+    def update_one(self, values):
+        """Adds one sample given as values in `columns` order (NaN where missing)."""
+        with self._lock:
+            for j, x in enumerate(values):
+                if not math.isfinite(x):
+                    self.missing[j] += 1
+                    continue
+                self.n[j] += 1
+                delta = x - self.mean[j]
+                self.mean[j] += delta / self.n[j]
+                self.m2[j] += delta * (x - self.mean[j])
+                self.counts[j][bisect.bisect_right(self.edges[j], x)] += 1
+
+    def profile(self) -> dict:
+        """Returns the sketch as a JSON-ready {column: {n, missing, mean, var, edges, counts}} dict."""
+        with self._lock:
+            return {col: {
+                "n": int(self.n[j]),
+                "missing": int(self.missing[j]),
+                "mean": float(self.mean[j]),
+                "var": float(self.m2[j] / (self.n[j] - 1)) if self.n[j] > 1 else float("nan"),
+                "edges": self.edges[j].tolist(),
+                "counts": self.counts[j].tolist(),
+            } for j, col in enumerate(self.columns)}
+
+    def scores(self) -> dict:
+        """
+        Returns per-column drift scores against the reference: `psi` (the
+        population stability index over the reference bins), `mean_shift`
+        (difference of means in reference standard deviations) and the
+        missing rates. Columns with fewer than MIN_SAMPLES values, or no
+        reference, score None. `drifted` lists the columns whose PSI exceeds
+        DRIFT_PSI. The result is JSON-ready.
+        """
+
+        current = self.profile()
+        columns = {}
+        for col, cur in current.items():
+            total = cur["n"] + cur["missing"]
+            entry = {
+                "n": cur["n"],
+                "mean": cur["mean"] if cur["n"] else float("nan"),
+                "std": math.sqrt(cur["var"]) if cur["n"] > 1 else float("nan"),
+                "missing_rate": cur["missing"] / total if total else float("nan"),
+                "psi": float("nan"),
+                "mean_shift": float("nan"),
+            }
+            ref = (self.reference or {}).get(col)
+            if ref is not None:
+                ref_total = ref["n"] + ref["missing"]
+                entry["reference_missing_rate"] = ref["missing"] / ref_total if ref_total else float("nan")
+                if cur["n"] >= MIN_SAMPLES and ref["n"]:
+                    entry["psi"] = population_stability_index(ref["counts"], cur["counts"])
+                    if ref["var"] > 0:
+                        entry["mean_shift"] = (cur["mean"] - ref["mean"]) / math.sqrt(ref["var"])
+            columns[col] = {name: _finite(value) if isinstance(value, float) else value for name, value in entry.items()}
+
+        drifted = [col for col, entry in columns.items() if entry["psi"] is not None and entry["psi"] > DRIFT_PSI]
+        return {"threshold_psi": DRIFT_PSI, "drifted": drifted, "columns": columns}
+
+
+def population_stability_index(expected, actual) -> float:
+    """PSI of the `actual` bin counts against `expected`; above about 0.25 is usually read as a real shift."""
+    p = np.maximum(np.asarray(expected, dtype="float64") / max(sum(expected), 1), _EPS)
+    q = np.maximum(np.asarray(actual, dtype="float64") / max(sum(actual), 1), _EPS)
+    return float(((q - p) * np.log(q / p)).sum())
+
+
+def build_reference(samples, bins: int = 10) -> dict:
+    """
+    Takes per-sample frames (e.g. from the training windows) and returns a
+    reference profile: each column's moments, missing count and histogram
+    over `bins` equal-mass bins cut at its quantiles.
+    """
+
+    frame = pd.concat([s.reindex(columns=MONITORED_COLUMNS) for s in samples], ignore_index=True)
+    values = frame.to_numpy(dtype="float64")
+    values[~np.isfinite(values)] = np.nan
+    reference = {}
+    for j, col in enumerate(MONITORED_COLUMNS):
+        x = values[:, j]
+        cuts = np.nanquantile(x, np.linspace(0, 1, bins + 1)[1:-1]) if np.isfinite(x).any() else []
+        reference[col] = {"edges": np.unique(cuts).tolist()}
+    monitor = DriftMonitor(reference)
+    monitor.update(frame)
+    return monitor.profile()
+
+
+def load_reference(path: str = REFERENCE_PATH):
+    """Returns the reference profile stored at `path`, or None if there is none."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def iter_file_samples(paths):
+    """Yields the per-sample feature frames of raw SWIS files, one chunk at a time."""
+    for path in paths:
+        yield from iter_feature_samples(iter_resampled_chunks(read_chunks(path, detect_format(path))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a drift reference profile, or score files against one.")
+    parser.add_argument("inputs", nargs="+", help="raw SWIS files or glob patterns (CSV, Parquet, Feather)")
+    parser.add_argument("--reference", default=REFERENCE_PATH)
+    parser.add_argument("--build", action="store_true", help="write the inputs' profile as the reference")
+    parser.add_argument("--bins", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    files = sorted({path for pattern in args.inputs for path in (glob.glob(pattern) or [pattern])})
+    if args.build:
+        reference = build_reference(iter_file_samples(files), args.bins)
+        with open(args.reference, "w") as f:
+            json.dump(reference, f, indent=1)
+        print(f"Reference profile of {len(files)} files ({reference['Vp']['n']} samples) written to {args.reference}")
+        return
+
+    reference = load_reference(args.reference)
+    if reference is None:
+        parser.error(f"No reference profile at {args.reference}; build one with --build.")
+    monitor = DriftMonitor(reference)
+    for samples in iter_file_samples(files):
+        monitor.update(samples)
+    scores = monitor.scores()
+    print(pd.DataFrame(scores["columns"]).T.astype(float).to_string(float_format=lambda v: f"{v:.4g}"))
+    print(f"Drifted (PSI > {DRIFT_PSI}): {', '.join(scores['drifted']) or 'none'}")
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.drift 'training_windows/*.csv' --build
+    # python -m app.Utils.drift new_data.csv
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from app.Utils.features import parse_timestamps
+
+ON_THRESHOLD = 0.45    # same as the single-window decision threshold
+OFF_THRESHOLD = 0.35
+EVENT_COLUMNS = ["onset", "end", "peak_time", "peak_probability", "n_windows"]
+
+
+def _empty_events() -> pd.DataFrame:
+    return pd.DataFrame({
+        "onset": pd.Series(dtype="datetime64[ns]"),
+        "end": pd.Series(dtype="datetime64[ns]"),
+        "peak_time": pd.Series(dtype="datetime64[ns]"),
+        "peak_probability": pd.Series(dtype="float64"),
+        "n_windows": pd.Series(dtype="int64"),
+    })
+
+
+class EventDetector:
+    """
+    Turns a probability timeline into CME events, a chunk at a time.
+
+    Hysteresis: an event starts at the first window with probability >=
+    `on` and lasts until a window drops below `off` (or has no probability).
+    Events separated by at most `merge_gap` are merged, then events shorter
+    than `min_duration` are dropped.
+
+    Each window is placed at its midpoint. An event runs from the midpoint of
+    its first active window to that of its last, and peak_time is the
+    midpoint of its most probable window. Chunks must arrive in time order.
+    The state carried between chunks is the open event and the last closed
+    one, so memory does not grow with the timeline.
+    """
+
+    def __init__(self, on: float = ON_THRESHOLD, off: float = OFF_THRESHOLD, min_duration="30min",
+                 merge_gap="1h"):
+        if off > on:
+            raise ValueError("The off threshold must not be above the on threshold.")
+        self.on = on
+        self.off = off
+        self.min_duration = pd.Timedelta(min_duration).value
+        self.merge_gap = pd.Timedelta(merge_gap).value
+        self._open = None       # [onset, end, peak_time, peak_probability, n_windows] of the running event
+        self._pending = None    # last closed event, held until nothing can merge into it
+        self.tz = None          # time zone of the timeline, given back to the event times
+
+    def update(self, timeline: pd.DataFrame) -> pd.DataFrame:
+        """
+        Takes the next timeline chunk (window_start, window_end, probability)
+        and returns the events that can no longer change.
+        """
+
+        if timeline.empty:
+            return _empty_events()
+        self.tz = getattr(timeline["window_start"].dtype, "tz", None)
+        start = timeline["window_start"].to_numpy(dtype="datetime64[ns]").view("int64")
+        end = timeline["window_end"].to_numpy(dtype="datetime64[ns]").view("int64")
+        t = start + (end - start) // 2
+        p = timeline["probability"].to_numpy(dtype="float64")
+
+        # Hysteresis state of every window: the last decisive window (above
+        # `on`, or below `off`/missing) wins, carried in from the previous chunk
+        decision = np.where(p >= self.on, 1, np.where(p >= self.off, -1, 0))
+        last = np.where(decision >= 0, np.arange(len(p)), -1)
+        np.maximum.accumulate(last, out=last)
+        active = np.where(last >= 0, decision[np.maximum(last, 0)], int(self._open is not None)) == 1
+
+        # Runs of active windows; a run touching the chunk start continues the open event
+        edges = np.diff(np.r_[0, active.astype("int8"), 0])
+        run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+        closed = []
+        if self._open is not None and not active[0]:
+            closed.extend(self._close(self._open))
+            self._open = None
+        for lo, hi in zip(run_starts, run_ends):
+            peak = lo + int(np.argmax(p[lo:hi + 1]))
+            run = [int(t[lo]), int(t[hi]), int(t[peak]), float(p[peak]), int(hi - lo + 1)]
+            if lo == 0 and self._open is not None:
+                run = self._join(self._open, run)
+                self._open = None
+            if hi == len(p) - 1:
+                self._open = run
+            else:
+                closed.extend(self._close(run))
+        return self._frame(closed)
+
+    def finish(self) -> pd.DataFrame:
+        """Closes the running event and returns the remaining events."""
+        closed = []
+        if self._open is not None:
+            closed.extend(self._close(self._open))
+            self._open = None
+        if self._pending is not None:
+            closed.extend(self._emit(self._pending))
+            self._pending = None
+        return self._frame(closed)
+
+    @staticmethod
+    def _join(first, second):
+        peak = first if first[3] >= second[3] else second
+        return [first[0], second[1], peak[2], peak[3], first[4] + second[4]]
+
+    def _close(self, event) -> list:
+        # Holds the event back while a later one could still merge into it
+        if self._pending is not None and event[0] - self._pending[1] <= self.merge_gap:
+            self._pending = self._join(self._pending, event)
+            return []
+        out = [] if self._pending is None else self._emit(self._pending)
+        self._pending = event
+        return out
+
+    def _emit(self, event) -> list:
+        return [event] if event[1] - event[0] >= self.min_duration else []
+
+    def _frame(self, events: list) -> pd.DataFrame:
+        if not events:
+            return _empty_events()
+        out = pd.DataFrame(events, columns=EVENT_COLUMNS)
+        for col in ("onset", "end", "peak_time"):
+            out[col] = pd.to_datetime(out[col])
+            if self.tz is not None:
+                out[col] = out[col].dt.tz_localize("UTC").dt.tz_convert(self.tz)
+        return out
+
+
+def detect_events(timelines, on: float = ON_THRESHOLD, off: float = OFF_THRESHOLD, min_duration="30min",
+                  merge_gap="1h") -> pd.DataFrame:
+    """
+    Takes a probability timeline (see score_timeline), or an iterable of
+    timeline chunks in time order, and returns one row per CME event with
+    onset, end, peak_time, peak_probability and n_windows.
+    See EventDetector for the rules.
+    """
+
+    if isinstance(timelines, pd.DataFrame):
+        timelines = [timelines]
+    detector = EventDetector(on, off, min_duration, merge_gap)
+    frames = [detector.update(timeline) for timeline in timelines]
+    frames.append(detector.finish())
+    frames = [frame for frame in frames if len(frame)]
+    return pd.concat(frames, ignore_index=True) if frames else _empty_events()
+
+
+def match_catalog(events: pd.DataFrame, catalog, before="1D", after="2D") -> pd.DataFrame:
+    """
+    Takes detected events and catalog event times (e.g. CACTUS halo CME
+    timestamps) and returns one row per catalog event with the index of
+    the matching detection (-1 if missed) and its onset delay.
+
+    A detection matches when its onset lies in [time - before, time + after],
+    the same T-1 to T+2 days span the model was trained on. The nearest
+    unclaimed onset wins, so one detection matches at most one catalog event.
+    """
+
+    times = parse_timestamps(pd.Series(catalog)).dropna().sort_values()
+    times = times.to_numpy(dtype="datetime64[ns]").view("int64")
+    onsets = events["onset"].to_numpy(dtype="datetime64[ns]").view("int64")
+    before, after = pd.Timedelta(before).value, pd.Timedelta(after).value
+
+    lo = np.searchsorted(onsets, times - before, side="left")
+    hi = np.searchsorted(onsets, times + after, side="right")
+    matched = np.full(len(times), -1, dtype="int64")
+    claimed = set()
+    for i in range(len(times)):
+        candidates = [j for j in range(lo[i], hi[i]) if j not in claimed]
+        if candidates:
+            matched[i] = min(candidates, key=lambda j: abs(onsets[j] - times[i]))
+            claimed.add(int(matched[i]))
+
+    hit = matched >= 0
+    delay = np.full(len(times), np.iinfo("int64").min)  # NaT for misses
+    delay[hit] = onsets[matched[hit]] - times[hit]
+    return pd.DataFrame({
+        "catalog_time": pd.to_datetime(times),
+        "event": matched,
+        "onset_delay": pd.to_timedelta(delay),
+    })
+
+
+def catalog_scores(matches: pd.DataFrame, n_events: int) -> dict:
+    """Returns hits, misses, false alarms, probability of detection and false alarm ratio."""
+    hits = int((matches["event"] >= 0).sum())
+    false_alarms = n_events - hits
+    return {
+        "hits": hits,
+        "misses": len(matches) - hits,
+        "false_alarms": false_alarms,
+        "pod": hits / len(matches) if len(matches) else float("nan"),
+        "far": false_alarms / n_events if n_events else float("nan"),
+    }
+
+
+def iter_timeline_file(path: str):
+    """Yields the row groups of a timeline Parquet file (e.g. a backfill's timeline.parquet) as frames."""
+    reader = pq.ParquetFile(path)
+    for i in range(reader.num_row_groups):
+        yield reader.read_row_group(i, columns=["window_start", "window_end", "probability"]).to_pandas()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect CME events in a probability timeline.")
+    parser.add_argument("timeline", help="timeline Parquet file, e.g. backfill_out/timeline.parquet")
+    parser.add_argument("--out", help="CSV file for the events (default: print them)")
+    parser.add_argument("--on", type=float, default=ON_THRESHOLD)
+    parser.add_argument("--off", type=float, default=OFF_THRESHOLD)
+    parser.add_argument("--min-duration", default="30min")
+    parser.add_argument("--merge-gap", default="1h")
+    parser.add_argument("--catalog", help="CSV of catalog event times to score against (first column)")
+    parser.add_argument("--before", default="1D", help="earliest onset before a catalog time that matches")
+    parser.add_argument("--after", default="2D", help="latest onset after a catalog time that matches")
+    args = parser.parse_args(argv)
+
+    events = detect_events(iter_timeline_file(args.timeline), args.on, args.off, args.min_duration, args.merge_gap)
+    if args.out:
+        events.to_csv(args.out, index=False)
+        print(f"{len(events)} events written to {args.out}")
+    else:
+        print(events.to_string(index=False))
+
+    if args.catalog:
+        catalog = pd.read_csv(args.catalog).iloc[:, 0]
+        matches = match_catalog(events, catalog, args.before, args.after)
+        print(matches.to_string(index=False))
+        print(catalog_scores(matches, len(events)))
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.events backfill_out/timeline.parquet --catalog cactus_halo.csv
+    main()
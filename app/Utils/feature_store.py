@@ -0,0 +1,147 @@
+import argparse
+import glob
+import os
+from itertools import chain
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.Utils.features import FEATURE_COLUMNS
+from app.Utils.ingest import detect_format, iter_feature_samples, iter_resampled_chunks, iter_window_features, read_chunks
+from app.Utils.inference import score_windows
+from app.Utils.model_registry import MODEL_PATH, get_compiled_model, get_model, get_model_version, with_model_version
+
+STORE_COLUMNS = ["timestamp", *FEATURE_COLUMNS]
+STORE_SCHEMA = pa.schema([("timestamp", pa.timestamp("ns"))] + [(col, pa.float64()) for col in FEATURE_COLUMNS])
+
+
+class FeatureStore:
+    """
+    On-disk store of the per-5-minute feature series, one Parquet file per
+    UTC day under `root` (day=YYYY-MM-DD.parquet).
+
+    Re-scoring a stored period with another model, window or threshold reads
+    these files directly, with no CSV parsing or resampling.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, day) -> str:
+        return os.path.join(self.root, f"day={pd.Timestamp(day):%Y-%m-%d}.parquet")
+
+    def days(self) -> list:
+        """Returns the stored days in order."""
+        names = sorted(glob.glob(os.path.join(self.root, "day=*.parquet")))
+        return [pd.Timestamp(os.path.basename(name)[4:14]) for name in names]
+
+    def write(self, samples) -> int:
+        """
+        Takes per-sample feature frames in time order and writes them to the
+        day partitions, replacing any day they touch. Returns the number of
+        rows written. Each day is written to a .tmp file and moved into place
+        once complete, so readers never see a half-written day and a failed
+        write leaves the stored one as it was.
+        """
+
+        os.makedirs(self.root, exist_ok=True)
+        writer, day, rows = None, None, 0
+        try:
+            for frame in samples:
+                frame = frame[STORE_COLUMNS]
+                for frame_day, part in frame.groupby(frame["timestamp"].dt.floor("D"), sort=True):
+                    if frame_day != day:
+                        if writer is not None:
+                            writer.close()
+                            writer = None
+                            os.replace(self._path(day) + ".tmp", self._path(day))
+                        day = frame_day
+                        writer = pq.ParquetWriter(self._path(day) + ".tmp", STORE_SCHEMA)
+                    writer.write_table(pa.Table.from_pandas(part, schema=STORE_SCHEMA, preserve_index=False))
+                    rows += len(part)
+            if writer is not None:
+                writer.close()
+                writer = None
+                os.replace(self._path(day) + ".tmp", self._path(day))
+        finally:
+            if writer is not None:  # interrupted mid-day
+                writer.close()
+                os.remove(self._path(day) + ".tmp")
+        return rows
+
+    def ingest(self, source, fmt: str = "csv", chunksize: int = 500_000) -> int:
+        """
+        Parses, resamples and featurizes a raw SWIS file once and stores the
+        result. A list of paths in time order is read as one continuous
+        series (each in its own format), so days spanning two files are
+        stored whole.
+        """
+        if isinstance(source, (list, tuple)):
+            chunks = chain.from_iterable(read_chunks(path, detect_format(path), chunksize) for path in source)
+        else:
+            chunks = read_chunks(source, fmt, chunksize)
+        return self.write(iter_feature_samples(iter_resampled_chunks(chunks)))
+
+    def iter_samples(self, start=None, end=None):
+        """Yields the stored per-sample feature frames between `start` and `end` (inclusive days)."""
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        for day in self.days():
+            if (start is not None and day < start.floor("D")) or (end is not None and day > end.floor("D")):
+                continue
+            frame = pq.read_table(self._path(day)).to_pandas()
+            if start is not None:
+                frame = frame[frame["timestamp"] >= start]
+            if end is not None:
+                frame = frame[frame["timestamp"] <= end]
+            yield frame
+
+    def read(self, start=None, end=None) -> pd.DataFrame:
+        """Returns the stored per-sample features between `start` and `end` as one frame."""
+        frames = list(self.iter_samples(start, end))
+        if not frames:
+            return pd.DataFrame(columns=STORE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def score(self, model, start=None, end=None, window="3h", stride="5min", threshold: float = None):
+        """Yields scored timeline frames for a stored period, a day at a time."""
+        for timeline in iter_window_features(self.iter_samples(start, end), window=window, stride=stride):
+            yield score_windows(model, timeline, threshold)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a day-partitioned feature store, or score a stored period.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="featurize raw SWIS files into the store")
+    ingest.add_argument("inputs", nargs="+", help="raw files or glob patterns (CSV, Parquet, Feather), read in name order")
+    ingest.add_argument("--root", required=True, help="store directory")
+    score = commands.add_parser("score", help="write the scored timeline of a stored period")
+    score.add_argument("--root", required=True, help="store directory")
+    score.add_argument("--out", required=True, help="output Parquet file")
+    score.add_argument("--start")
+    score.add_argument("--end")
+    score.add_argument("--window", default="3h")
+    score.add_argument("--stride", default="5min")
+    score.add_argument("--threshold", type=float)
+    score.add_argument("--model", default=MODEL_PATH)
+    score.add_argument("--backend", choices=["sklearn", "compiled"], default="sklearn")
+    args = parser.parse_args(argv)
+
+    store = FeatureStore(args.root)
+    if args.command == "ingest":
+        files = sorted({path for pattern in args.inputs for path in (glob.glob(pattern) or [pattern])})
+        rows = store.ingest(files)
+        print(f"Stored {rows} samples from {len(files)} files in {args.root} ({len(store.days())} days)")
+        return
+
+    model = get_compiled_model(args.model) if args.backend == "compiled" else get_model(args.model)
+    frames = list(store.score(model, args.start, args.end, args.window, args.stride, args.threshold))
+    timeline = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    table = pa.Table.from_pandas(timeline, preserve_index=False)
+    pq.write_table(table.cast(with_model_version(table.schema, get_model_version(args.model))), args.out)
+    print(f"Scored {len(timeline)} windows -> {args.out}")
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.feature_store ingest 'archive/*.csv' --root feature_store
+    # python -m app.Utils.feature_store score --root feature_store --out timeline.parquet --window 6h
+    main()
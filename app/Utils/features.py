@@ -1,10 +1,217 @@
+from collections.abc import Mapping
 import pandas as pd
 import numpy as np
+from app.Utils.instrumentation import stage
+
+FEATURE_COLUMNS = ["alpha_proton_ratio", "vp_std_15min", "alpha_over_vpstd", "alpha_tp_ratio"]
+RAW_COLUMNS = ["proton_density", "proton_speed", "proton_temperature", "alpha_density"]
+CADENCE_NS = 300 * 10**9
+CADENCE = pd.Timedelta(CADENCE_NS, unit="ns")
+# Neighbours further apart than this are on opposite sides of a data gap,
+# i.e. outside the centered 15-minute window of the sample between them
+MAX_NEIGHBOUR_GAP_NS = CADENCE_NS * 3 // 2
+
+
+def parse_timestamps(values) -> pd.Series:
+    """
+    Parses a timestamp column. Strings are read with the fixed ISO 8601
+    parser first; only entries it rejects go through pandas' slower format
+    inference. Columns that are already datetimes are returned unchanged.
+    Unparseable entries become NaT. A column mixing UTC offsets, or offsets
+    and naive times, comes back in UTC, with naive times taken as UTC.
+    """
+
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if not (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)):
+        return pd.to_datetime(values, errors="coerce")
+
+    parsed = pd.to_datetime(values, format="ISO8601", errors="coerce")
+    if parsed.dtype == object:
+        # Mixed UTC offsets (e.g. Z next to +05:30) have no common time zone; put them all on UTC
+        parsed = pd.to_datetime(values, format="ISO8601", errors="coerce", utc=True)
+    failed = parsed.isna()
+    if failed.any():
+        retry = failed & values.notna()
+        if retry.any():
+            tz = getattr(parsed.dt, "tz", None)
+            retried = pd.to_datetime(values[retry], errors="coerce", utc=tz is not None)
+            if tz is not None:
+                retried = retried.dt.tz_convert(tz)
+            if retried.dtype != parsed.dtype:
+                # Mixed tz-aware and naive entries: naive ones are taken as UTC
+                return pd.to_datetime(values, errors="coerce", utc=True)
+            parsed[retry] = retried
+    return parsed
+
+
+def modal_interval(ts: np.ndarray):
+    """
+    Returns the most common step between sorted int64 nanosecond timestamps
+    (the smallest one on ties), or None for fewer than 2 samples. Evenly
+    spaced input is recognised in one pass, without sorting the steps.
+    """
+
+    if len(ts) < 2:
+        return None
+    diffs = np.diff(ts)
+    if (diffs == diffs[0]).all():
+        return int(diffs[0])
+    uniques, counts = np.unique(diffs, return_counts=True)
+    return int(uniques[np.argmax(counts)])
+
+
+def sort_samples(ts: np.ndarray, values: np.ndarray):
+    """Sorts int64 nanosecond timestamps and their rows of values by time; sorted input is returned as is."""
+    if len(ts) > 1 and (ts[1:] < ts[:-1]).any():
+        order = np.argsort(ts, kind="stable")
+        return ts[order], values[order]
+    return ts, values
+
+
+def check_cadence(ts: np.ndarray):
+    """
+    Returns the modal step of sorted int64 nanosecond timestamps (None for
+    fewer than 2 samples). Raises ValueError when it is above 5 minutes.
+    """
+
+    interval = modal_interval(ts)
+    if interval is not None and interval > CADENCE_NS:
+        raise ValueError(f"Your data is too sparse (interval ≈ {int(interval / 10**9)}s). "
+                         f"Please provide higher-resolution data (≤5min).")
+    return interval
+
+
+def bin_sums(ts: np.ndarray, values: np.ndarray):
+    """
+    Groups sorted samples into 5-minute bins. Returns the bin numbers
+    (timestamp // CADENCE_NS) and the per-column sums and counts of the
+    non-NaN values in each, so a bin cut by a chunk edge can be completed.
+    """
+
+    bins = ts // CADENCE_NS
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+    counts = np.add.reduceat(valid.astype("int64"), starts, axis=0)
+    return bins[starts], sums, counts
+
+
+def resample_to_cadence(ts: np.ndarray, values: np.ndarray):
+    """
+    Sorts samples (int64 nanosecond timestamps and an (n, 4) array of values)
+    and brings them to the 5-minute cadence. Exact 5-minute data passes
+    straight through and sub-5-minute data is averaged into 5-minute bins,
+    like resample("5min").mean().dropna(). Raises ValueError for sparser data.
+    """
+
+    with stage("sort", len(ts)):
+        ts, values = sort_samples(ts, values)
+
+    with stage("resample", len(ts)):
+        interval = check_cadence(ts)
+        if interval is not None and interval < CADENCE_NS:
+            ts, values = _resample_5min_numpy(ts, values)
+    return ts, values
+
+
+def prepare_window(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Validates, sorts and resamples raw SWIS data to the 5-minute cadence the
+    model was trained on. Returns a new frame with the timestamp and the
+    plasma columns renamed to Np, Vp, Tp and Alpha; other columns are dropped.
+
+    Already-sorted input skips the sort, and exact 5-minute data passes
+    straight through. Sub-5-minute data is averaged into 5-minute bins by
+    integer floor division, like resample("5min").mean().dropna().
+    Raises error if input interval > 5min.
+    """
+
+    required_cols = {"timestamp", "proton_density", "proton_speed", "proton_temperature", "alpha_density"}
+    if not required_cols.issubset(df.columns):
+        raise ValueError("Please ensure your CSV contains all the following columns:\n\n"
+                         + "\n".join(required_cols) +
+                         "\n\nEach row should represent ≤5-minute interval measurements.")
+
+    with stage("parse_timestamps", len(df)):
+        timestamps = parse_timestamps(df["timestamp"])
+        tz = getattr(timestamps.dt, "tz", None)
+        if tz is not None:
+            timestamps = timestamps.dt.tz_convert(None)
+        keep = timestamps.notna().to_numpy()  # drop invalid timestamps
+        ts = timestamps.to_numpy(dtype="datetime64[ns]").view("int64")[keep]
+        values = df[RAW_COLUMNS].to_numpy(dtype="float64")[keep]
+
+    ts, values = resample_to_cadence(ts, values)
+
+    out = pd.DataFrame(values, columns=["Np", "Vp", "Tp", "Alpha"])
+    timestamps = pd.DatetimeIndex(ts.view("datetime64[ns]"))
+    out.insert(0, "timestamp", timestamps if tz is None else timestamps.tz_localize("UTC").tz_convert(tz))
+    return out
+
+
+def compute_feature_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the 4 per-sample feature columns to a prepared 5-minute frame.
+
+    Infinite values are turned into NaN; rows are not dropped so that the
+    result stays aligned with the input timestamps. `vp_std_15min` is NaN
+    where a neighbouring sample is missing (see rolling_vp_std).
+    """
+
+    with stage("features", len(df)):
+        df["alpha_proton_ratio"] = df["Alpha"] / df["Np"].replace(0, np.nan)
+        with stage("rolling_std", len(df)):
+            ts = df["timestamp"].to_numpy(dtype="datetime64[ns]").view("int64")
+            df["vp_std_15min"] = rolling_vp_std(ts, df["Vp"].to_numpy(dtype="float64"))
+        df["alpha_over_vpstd"] = df["alpha_proton_ratio"] / df["vp_std_15min"].replace(0, np.nan)
+        df["alpha_tp_ratio"] = df["Alpha"] / df["Tp"].replace(0, np.nan)
+
+        df[FEATURE_COLUMNS] = df[FEATURE_COLUMNS].replace([np.inf, -np.inf], np.nan)
+    return df
+
+
+def rolling_vp_std(ts: np.ndarray, vp: np.ndarray) -> np.ndarray:
+    """
+    Takes sorted int64 nanosecond timestamps and proton speeds and returns
+    the centered 15-minute std of Vp (sample std of a sample and its 2
+    neighbours).
+
+    The series is split into segments at every step longer than
+    MAX_NEIGHBOUR_GAP_NS, and only samples with a neighbour on both sides
+    in the same segment get a value, so a window never spans a data gap.
+    The variance comes from the pairwise differences, which is exactly 0
+    when the three speeds are equal (as rolling().std() gives), so the
+    zero-std guard in compute_feature_columns still applies; a closed form
+    through the mean leaves rounding residue there. It runs over all
+    samples at once, in place where it can, without Python loops.
+    """
+
+    vp_std = np.full(len(vp), np.nan)
+    if len(vp) < 3:
+        return vp_std
+
+    prev, mid, nxt = vp[:-2], vp[1:-1], vp[2:]
+    var = (prev - mid) ** 2
+    var += (mid - nxt) ** 2
+    var += (prev - nxt) ** 2
+    var /= 6
+    np.sqrt(var, out=vp_std[1:-1])
+
+    gap = np.diff(ts) > MAX_NEIGHBOUR_GAP_NS
+    vp_std[1:-1][gap[:-1] | gap[1:]] = np.nan
+    return vp_std
+
 
 def extract_features_from_window(df: pd.DataFrame) -> pd.DataFrame:
     """
     Takes solar wind data as a DataFrame and computes 4 physics-informed features.
 
+    A mapping of column name -> array (e.g. a dict of NumPy arrays) takes the
+    pure-NumPy path instead, which gives the same result without the pandas
+    overhead.
+
     Expected Columns:
         - timestamp (datetime)
         - proton_density
@@ -16,41 +223,21 @@ def extract_features_from_window(df: pd.DataFrame) -> pd.DataFrame:
     Raises error if input interval > 5min.
     """
 
-    required_cols = {"timestamp", "proton_density", "proton_speed", "proton_temperature", "alpha_density"}
-    if not required_cols.issubset(df.columns):
-        raise ValueError("Please ensure your CSV contains all the following columns:\n\n"
-                         + "\n".join(required_cols) +
-                         "\n\nEach row should represent ≤5-minute interval measurements.")
+    if isinstance(df, Mapping):
+        with stage("features_numpy", len(df["timestamp"]) if "timestamp" in df else None):
+            return _extract_features_numpy(df)
+
+    return window_feature_means(compute_feature_columns(prepare_window(df)))
+
+
+def window_feature_means(samples: pd.DataFrame) -> pd.DataFrame:
+    """
+    Takes per-sample features (see compute_feature_columns) and returns the
+    1-row frame of their means over the samples where all 4 are defined,
+    as returned by extract_features_from_window.
+    """
 
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    df = df.dropna(subset=["timestamp"])  # drop invalid timestamps
-    df = df.sort_values("timestamp").reset_index(drop=True)
-
-    diffs = df["timestamp"].diff().dropna().dt.total_seconds()
-    if not diffs.empty:
-        mode_interval = diffs.mode()[0]
-        if mode_interval < 300:
-            # Resample to 5min
-            df = df.set_index("timestamp").resample("5min").mean().dropna().reset_index()
-        elif mode_interval > 300:
-            raise ValueError(f"Your data is too sparse (interval ≈ {int(mode_interval)}s). "
-                             f"Please provide higher-resolution data (≤5min).")
-
-    df = df.rename(columns={
-        "proton_density": "Np",
-        "proton_speed": "Vp",
-        "proton_temperature": "Tp",
-        "alpha_density": "Alpha"
-    })
-
-    df["alpha_proton_ratio"] = df["Alpha"] / df["Np"].replace(0, np.nan)
-    df["vp_std_15min"] = df["Vp"].rolling(window=3, center=True).std()
-    df["alpha_over_vpstd"] = df["alpha_proton_ratio"] / df["vp_std_15min"].replace(0, np.nan)
-    df["alpha_tp_ratio"] = df["Alpha"] / df["Tp"].replace(0, np.nan)
-
-    df = df.replace([np.inf, -np.inf], np.nan).dropna(subset=[
-        "alpha_proton_ratio", "vp_std_15min", "alpha_over_vpstd", "alpha_tp_ratio"
-    ])
+    df = samples.dropna(subset=FEATURE_COLUMNS)
 
     if df.empty:
         return pd.DataFrame([{
@@ -66,3 +253,154 @@ def extract_features_from_window(df: pd.DataFrame) -> pd.DataFrame:
         "alpha_over_vpstd": df["alpha_over_vpstd"].mean(),
         "alpha_tp_ratio": df["alpha_tp_ratio"].mean()
     }])
+
+
+def _extract_features_numpy(data: Mapping) -> pd.DataFrame:
+    """
+    NumPy implementation of extract_features_from_window for array inputs.
+
+    Follows the pandas version step for step, so results agree to
+    floating-point rounding.
+    """
+
+    required_cols = {"timestamp", *RAW_COLUMNS}
+    if not required_cols.issubset(data.keys()):
+        raise ValueError("Please ensure your CSV contains all the following columns:\n\n"
+                         + "\n".join(required_cols) +
+                         "\n\nEach row should represent ≤5-minute interval measurements.")
+
+    ts = np.asarray(data["timestamp"], dtype="datetime64[ns]").view("int64")
+    values = np.column_stack([np.asarray(data[col], dtype="float64") for col in RAW_COLUMNS])
+
+    keep = ts != np.iinfo("int64").min  # drop NaT timestamps
+    ts, values = resample_to_cadence(ts[keep], values[keep])
+
+    features = _feature_matrix_numpy(ts, values)
+    features = features[~np.isnan(features).any(axis=1)]
+    if len(features) == 0:
+        return pd.DataFrame([dict.fromkeys(FEATURE_COLUMNS, np.nan)])
+    means = features.sum(axis=0) / len(features)
+    return pd.DataFrame([dict(zip(FEATURE_COLUMNS, means))])
+
+
+def _resample_5min_numpy(ts: np.ndarray, values: np.ndarray):
+    """
+    Averages sorted samples into 5-minute bins, skipping NaNs per column and
+    dropping bins where any column has no valid sample, like
+    resample("5min").mean().dropna().
+    """
+
+    bins, sums, counts = bin_sums(ts, values)
+    keep = (counts > 0).all(axis=1)
+    return bins[keep] * CADENCE_NS, sums[keep] / counts[keep]
+
+
+def _feature_matrix_numpy(ts: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Takes sorted int64 nanosecond timestamps and an (n, 4) array of Np, Vp,
+    Tp, Alpha and returns the (n, 4) matrix of per-sample features, NaN
+    where a feature is undefined.
+    """
+
+    n_p, vp, tp, alpha = (np.ascontiguousarray(values[:, i]) for i in range(4))
+    vp_std = rolling_vp_std(ts, vp)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        alpha_proton_ratio = alpha / np.where(n_p == 0, np.nan, n_p)
+        alpha_over_vpstd = alpha_proton_ratio / np.where(vp_std == 0, np.nan, vp_std)
+        alpha_tp_ratio = alpha / np.where(tp == 0, np.nan, tp)
+
+    features = np.column_stack([alpha_proton_ratio, vp_std, alpha_over_vpstd, alpha_tp_ratio])
+    features[np.isinf(features)] = np.nan
+    return features
+
+
+def extract_rolling_features(df: pd.DataFrame, window="3h", stride="5min", min_samples: int = 1) -> pd.DataFrame:
+    """
+    Takes solar wind data as a DataFrame and computes the 4 features over
+    sliding time windows instead of one whole-file average.
+
+    Each window covers [window_start, window_end) and starts `stride` after
+    the previous one. Window means come from cumulative sums over the valid
+    samples, so the cost is O(rows + windows) however long the window is.
+    The rolling Vp std is computed once over the full series, so samples at
+    a window edge use their real neighbours.
+
+    Returns one row per window with window_start, window_end, n_samples and
+    the 4 feature columns (NaN when fewer than `min_samples` valid samples).
+    """
+
+    return sample_window_features(compute_feature_columns(prepare_window(df)), window, stride, min_samples)
+
+
+def sample_window_features(samples: pd.DataFrame, window="3h", stride="5min", min_samples: int = 1) -> pd.DataFrame:
+    """
+    Same as extract_rolling_features, for per-sample features that were
+    already computed (see compute_feature_columns).
+    """
+
+    window = pd.Timedelta(window)
+    stride = pd.Timedelta(stride)
+    if window <= pd.Timedelta(0) or stride <= pd.Timedelta(0):
+        raise ValueError("Window length and stride must both be positive.")
+
+    if samples.empty:
+        return rolling_window_means(samples, np.array([], dtype="int64"), window, min_samples)
+
+    # Windows are laid out so the last one still ends inside the data span
+    ts = samples["timestamp"].to_numpy(dtype="datetime64[ns]").view("int64")
+    last_start = max(ts[0], ts[-1] + CADENCE_NS - window.value)
+    return rolling_window_means(samples, window_starts(ts[0], last_start, stride), window, min_samples)
+
+
+def window_starts(first: int, last: int, stride) -> np.ndarray:
+    """
+    Returns the int64 nanosecond window starts first, first + stride, ... up
+    to and including `last`. Counted in integers: np.arange sizes its output
+    in float64, which drops the last start at epoch-nanosecond magnitudes.
+    """
+
+    stride = pd.Timedelta(stride).value
+    count = max((int(last) - int(first)) // stride + 1, 0)
+    return int(first) + stride * np.arange(count, dtype="int64")
+
+
+def rolling_window_means(samples: pd.DataFrame, starts: np.ndarray, window, min_samples: int = 1) -> pd.DataFrame:
+    """
+    Takes per-sample features (timestamp + the 4 feature columns) and the
+    window start times in int64 nanoseconds, and returns the mean of each
+    feature over [start, start + window).
+
+    Uses prefix sums over the jointly-valid rows and binary search for the
+    window bounds, so the cost does not depend on the window length.
+    Window times are in the samples' time zone, like prepare_window's.
+    """
+
+    window = pd.Timedelta(window)
+    ts = samples["timestamp"].to_numpy(dtype="datetime64[ns]").view("int64")
+    values = samples[FEATURE_COLUMNS].to_numpy(dtype="float64")
+    valid = ~np.isnan(values).any(axis=1)
+
+    # Prefix sums over jointly-valid rows, matching the dropna in the single-window path
+    sums = np.zeros((len(values) + 1, len(FEATURE_COLUMNS)))
+    np.cumsum(np.where(valid[:, None], values, 0.0), axis=0, out=sums[1:])
+    counts = np.zeros(len(values) + 1, dtype="int64")
+    np.cumsum(valid, out=counts[1:])
+
+    starts = np.asarray(starts, dtype="int64")
+    ends = starts + window.value
+    lo = np.searchsorted(ts, starts, side="left")
+    hi = np.searchsorted(ts, ends, side="left")
+    n = counts[hi] - counts[lo]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (sums[hi] - sums[lo]) / n[:, None]
+    means[n < max(min_samples, 1)] = np.nan
+
+    out = pd.DataFrame(means, columns=FEATURE_COLUMNS)
+    out.insert(0, "n_samples", n)
+    tz = getattr(samples["timestamp"].dtype, "tz", None)
+    for col, times in (("window_end", ends), ("window_start", starts)):
+        times = pd.DatetimeIndex(times.view("datetime64[ns]"))
+        out.insert(0, col, times if tz is None else times.tz_localize("UTC").tz_convert(tz))
+    return out
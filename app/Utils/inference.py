@@ -0,0 +1,93 @@
+import pandas as pd
+import numpy as np
+from app.Utils.features import FEATURE_COLUMNS, extract_features_from_window, extract_rolling_features
+from app.Utils.instrumentation import stage
+
+
+def score_timeline(model, df: pd.DataFrame, window="3h", stride="5min", threshold: float = None) -> pd.DataFrame:
+    """
+    Takes solar wind data and returns a per-window CME probability timeline.
+
+    Features for every window are computed in one vectorized pass and scored
+    with a single `predict_proba` call. Windows without enough valid data get
+    a NaN probability. If `threshold` is given, a boolean `cme` column is added.
+    """
+
+    return score_windows(model, extract_rolling_features(df, window=window, stride=stride), threshold)
+
+
+def score_windows(model, timeline: pd.DataFrame, threshold: float = None) -> pd.DataFrame:
+    """
+    Adds a `probability` column (and `cme` if `threshold` is given) to a
+    frame of per-window features, using one `predict_proba` call.
+    """
+
+    timeline["probability"] = np.nan
+
+    scorable = timeline[FEATURE_COLUMNS].notna().all(axis=1).to_numpy()
+    if scorable.any():
+        features = timeline.loc[scorable, FEATURE_COLUMNS]
+        with stage("inference", len(features)):
+            timeline.loc[scorable, "probability"] = model.predict_proba(features)[:, 1]
+
+    if threshold is not None:
+        timeline["cme"] = timeline["probability"] >= threshold
+    return timeline
+
+
+def split_labeled_windows(df: pd.DataFrame, label_col: str = "window_id") -> dict:
+    """
+    Takes one DataFrame holding many windows tagged by `label_col` and
+    returns a {label: window DataFrame} mapping for predict_batch.
+    """
+
+    if label_col not in df.columns:
+        raise ValueError(f"Missing window label column: {label_col}")
+    return {label: group.drop(columns=label_col).reset_index(drop=True)
+            for label, group in df.groupby(label_col, sort=False)}
+
+
+def predict_batch(model, windows, threshold: float = None) -> pd.DataFrame:
+    """
+    Takes many windows of solar wind data and scores them with one model call.
+
+    `windows` is either a {label: DataFrame} mapping or a sequence of
+    DataFrames (labelled 0..n-1). Features are extracted per window, stacked
+    into one matrix and passed to a single `predict_proba` call, so the
+    ensemble's per-call overhead is paid once per batch.
+
+    Returns one row per window, indexed by label, with the 4 features,
+    `probability` and `error`. Windows that fail validation or lack enough
+    valid data keep a NaN probability and report why in `error`.
+    If `threshold` is given, a boolean `cme` column is added.
+    """
+
+    if not hasattr(windows, "items"):
+        windows = dict(enumerate(windows))
+
+    rows, errors = [], []
+    for label, window in windows.items():
+        try:
+            features_df = extract_features_from_window(window)
+            error = None
+            if features_df.isnull().values.any():
+                error = "Not enough valid data available for feature computation (~15 min needed)."
+        except ValueError as e:
+            features_df = pd.DataFrame([dict.fromkeys(FEATURE_COLUMNS, np.nan)])
+            error = str(e)
+        rows.append(features_df.iloc[0])
+        errors.append(error)
+
+    result = pd.DataFrame(rows, columns=FEATURE_COLUMNS)
+    result.index = pd.Index(list(windows.keys()), name="window")
+    result["probability"] = np.nan
+    result["error"] = errors
+
+    scorable = result["error"].isna().to_numpy()
+    if scorable.any():
+        with stage("inference", int(scorable.sum())):
+            result.loc[scorable, "probability"] = model.predict_proba(result.loc[scorable, FEATURE_COLUMNS])[:, 1]
+
+    if threshold is not None:
+        result["cme"] = result["probability"] >= threshold
+    return result
@@ -0,0 +1,360 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.Utils.features import (
+    CADENCE_NS, RAW_COLUMNS, bin_sums, check_cadence, compute_feature_columns, parse_timestamps,
+    rolling_window_means, sort_samples, window_starts,
+)
+from app.Utils.inference import score_windows
+from app.Utils.instrumentation import stage
+
+CSV_DTYPES = {col: "float64" for col in RAW_COLUMNS}
+SAMPLE_ROWS = 500  # rows read by check_upload
+RENAMED = {"proton_density": "Np", "proton_speed": "Vp", "proton_temperature": "Tp", "alpha_density": "Alpha"}
+INPUT_FORMATS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet",
+                 ".feather": "feather", ".arrow": "feather", ".ipc": "feather"}
+
+
+def detect_format(filename: str) -> str:
+    """Returns "csv", "parquet" or "feather" from a file name; unknown suffixes are read as CSV."""
+    return INPUT_FORMATS.get(os.path.splitext(filename or "")[1].lower(), "csv")
+
+
+def _missing_columns_error(e: Exception) -> ValueError:
+    return ValueError("Please ensure your file contains all the following columns:\n\n"
+                      + "\n".join(["timestamp", *RAW_COLUMNS]) + f"\n\n({e})")
+
+
+def read_table(source, fmt: str, columns=("timestamp", *RAW_COLUMNS)) -> pa.Table:
+    """
+    Reads a Parquet or Feather/Arrow IPC file into an Arrow table with only
+    `columns` (all columns if None). Feather files are memory-mapped when
+    `source` is a path.
+    """
+
+    columns = None if columns is None else list(columns)
+    try:
+        if fmt == "parquet":
+            return pq.read_table(source, columns=columns)
+        if fmt == "feather":
+            if isinstance(source, str):
+                source = pa.memory_map(source)
+            table = pa.ipc.open_file(source).read_all()
+            return table if columns is None else table.select(columns)
+    except (KeyError, pa.ArrowInvalid) as e:
+        raise _missing_columns_error(e) from e
+    raise ValueError(f"Unsupported columnar format: {fmt}")
+
+
+def table_to_arrays(table: pa.Table) -> dict:
+    """
+    Converts an Arrow table to the {column: ndarray} mapping taken by
+    extract_features_from_window's NumPy path. Single-chunk float64 columns
+    without nulls are viewed without copying; the timestamp column is
+    parsed (see parse_timestamps) unless it is already typed.
+    """
+
+    arrays = {}
+    for col in RAW_COLUMNS:
+        column = table.column(col)
+        if not pa.types.is_float64(column.type):
+            column = column.cast(pa.float64())
+        arrays[col] = column.to_numpy()
+
+    ts = table.column("timestamp")
+    if pa.types.is_timestamp(ts.type) or pa.types.is_date(ts.type):
+        tz = getattr(ts.type, "tz", None)
+        timestamps = pd.DatetimeIndex(ts.cast(pa.timestamp("ns", tz=tz)).to_numpy())
+        arrays["timestamp"] = timestamps if tz is None else timestamps.tz_localize("UTC").tz_convert(tz)
+    else:
+        arrays["timestamp"] = parse_timestamps(ts.to_pandas()).array
+    return arrays
+
+
+def table_to_frame(table: pa.Table) -> pd.DataFrame:
+    """
+    Converts an Arrow table to a DataFrame, building the timestamp and
+    plasma columns from table_to_arrays without consolidating them into one
+    block, so the plasma columns are not copied. Any other columns go
+    through to_pandas. The plasma columns may be read-only views. Tables
+    without all the required columns are converted as they are.
+    """
+
+    if not {"timestamp", *RAW_COLUMNS}.issubset(table.column_names):
+        return table.to_pandas()
+    arrays = table_to_arrays(table)
+    others = [col for col in table.column_names if col not in arrays]
+    if others:
+        rest = table.select(others).to_pandas()
+        arrays.update({col: rest[col] for col in others})
+    return pd.DataFrame({col: arrays[col] for col in table.column_names}, copy=False)
+
+
+def _read_sample(source, fmt: str, sample_rows: int) -> pd.DataFrame:
+    required_cols = ["timestamp", *RAW_COLUMNS]
+    if fmt == "csv":
+        return pd.read_csv(source, nrows=sample_rows)
+    if fmt == "parquet":
+        reader = pq.ParquetFile(source)
+        schema = reader.schema_arrow
+        batches = reader.iter_batches(batch_size=sample_rows, columns=[c for c in required_cols if c in schema.names])
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(source) if isinstance(source, str) else source)
+        schema = reader.schema
+        batches = (reader.get_batch(i) for i in range(min(reader.num_record_batches, 1)))
+    missing = [col for col in required_cols if col not in schema.names]
+    if missing:
+        raise _missing_columns_error(f"missing {', '.join(missing)}")
+    batch = next(iter(batches), None)
+    if batch is None:
+        return schema.empty_table().to_pandas()
+    return pa.Table.from_batches([batch.slice(0, sample_rows)]).select(required_cols).to_pandas()
+
+
+def check_upload(source, fmt: str = "csv", sample_rows: int = SAMPLE_ROWS):
+    """
+    Rejects an upload that cannot be scored from its header and first
+    `sample_rows` rows, before the whole file is parsed: the 5 required
+    columns must exist, the plasma columns must be numeric, the timestamps
+    must parse, and their most common step must not exceed 5 minutes (the
+    same rule as prepare_window). Raises ValueError; returns None when the
+    sample looks fine.
+
+    `source` is bytes, a path or a seekable file object, which is rewound
+    to where it was.
+    """
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    position = source.tell() if hasattr(source, "tell") else None
+    try:
+        with stage("check_upload") as s:
+            sample = _read_sample(source, fmt, sample_rows)
+            s.rows = len(sample)
+            missing = [col for col in ["timestamp", *RAW_COLUMNS] if col not in sample.columns]
+            if missing:
+                raise _missing_columns_error(f"missing {', '.join(missing)}")
+            if sample.empty:
+                raise ValueError("The file has no data rows.")
+
+            for col in RAW_COLUMNS:
+                if pd.api.types.is_numeric_dtype(sample[col]):
+                    continue
+                values = sample[col]
+                bad = values.notna() & pd.to_numeric(values, errors="coerce").isna()
+                if bad.any():
+                    raise ValueError(f"Column {col} must be numeric (found {values[bad].iloc[0]!r} in row "
+                                     f"{int(np.flatnonzero(bad.to_numpy())[0]) + 1}).")
+
+            timestamps = parse_timestamps(sample["timestamp"]).dropna()
+            if timestamps.empty:
+                raise ValueError(f"Could not parse the timestamp column (e.g. {sample['timestamp'].iloc[0]!r}).")
+            check_cadence(np.sort(timestamps.to_numpy(dtype="datetime64[ns]").view("int64")))
+    finally:
+        if position is not None:
+            source.seek(position)
+
+
+def read_frame(source, fmt: str = "csv") -> pd.DataFrame:
+    """Reads a whole upload of any supported format into a DataFrame with all its columns."""
+    with stage("parse") as s:
+        df = pd.read_csv(source) if fmt == "csv" else table_to_frame(read_table(source, fmt, columns=None))
+        s.rows = len(df)
+    return df
+
+
+def read_chunks(source, fmt: str = "csv", chunksize: int = 500_000):
+    """
+    Yields DataFrame chunks of the 5 required columns, with parsed
+    timestamps, for any supported format.
+    """
+
+    if fmt == "csv":
+        yield from read_csv_chunks(source, chunksize)
+        return
+
+    required_cols = ["timestamp", *RAW_COLUMNS]
+    if fmt == "parquet":
+        try:
+            batches = pq.ParquetFile(source).iter_batches(batch_size=chunksize, columns=required_cols)
+        except (KeyError, pa.ArrowInvalid) as e:
+            raise _missing_columns_error(e) from e
+    else:
+        batches = read_table(source, fmt).to_batches(max_chunksize=chunksize)
+
+    for batch in batches:
+        chunk = table_to_frame(pa.Table.from_batches([batch]).select(required_cols))
+        yield chunk.dropna(subset=["timestamp"])
+
+
+def read_csv_chunks(source, chunksize: int = 500_000):
+    """
+    Reads only the 5 required columns of a SWIS CSV, `chunksize` rows at a
+    time, with explicit float64 dtypes and parsed timestamps.
+    Invalid timestamps are dropped.
+    """
+
+    required_cols = ["timestamp", *RAW_COLUMNS]
+    try:
+        reader = pd.read_csv(source, usecols=required_cols, dtype=CSV_DTYPES, chunksize=chunksize)
+    except ValueError as e:
+        raise ValueError("Please ensure your CSV contains all the following columns:\n\n"
+                         + "\n".join(required_cols) + f"\n\n({e})") from e
+
+    with reader:
+        for chunk in reader:
+            chunk["timestamp"] = parse_timestamps(chunk["timestamp"])
+            yield chunk.dropna(subset=["timestamp"])
+
+
+def iter_resampled_chunks(chunks):
+    """
+    Takes raw chunks in time order and yields 5-minute frames (timestamp, Np,
+    Vp, Tp, Alpha), like prepare_window but without holding the whole file.
+
+    The cadence is decided on the first chunk. Sub-5-minute data is averaged
+    into 5-minute bins, and the last, possibly incomplete, bin of each chunk
+    is carried into the next one. Exact 5-minute data passes straight through.
+    Raises ValueError for sparser data or out-of-order chunks.
+    """
+
+    mode = None
+    held = []          # chunks held back until there are 2 rows to estimate the cadence from
+    carry = None       # (bin, sums, counts) of the bin still being filled
+    last_ts = None
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        ts = chunk["timestamp"].to_numpy(dtype="datetime64[ns]").view("int64")
+        ts, values = sort_samples(ts, chunk[RAW_COLUMNS].to_numpy(dtype="float64"))
+        if last_ts is not None and ts[0] < last_ts:
+            raise ValueError("Streaming ingestion needs input sorted by timestamp.")
+        last_ts = ts[-1]
+
+        if mode is None:
+            held.append((ts, values))
+            ts = np.concatenate([h[0] for h in held])
+            values = np.vstack([h[1] for h in held])
+            if len(ts) < 2:
+                continue
+            held = []
+            mode = "resample" if check_cadence(ts) < CADENCE_NS else "passthrough"
+
+        if mode == "passthrough":
+            yield _frame(ts, values)
+            continue
+
+        bins, sums, counts = bin_sums(ts, values)
+        if carry is not None:
+            if bins[0] == carry[0]:
+                sums[0] += carry[1]
+                counts[0] += carry[2]
+            else:
+                bins, sums, counts = np.r_[carry[0], bins], np.vstack([carry[1], sums]), np.vstack([carry[2], counts])
+        carry = (bins[-1], sums[-1], counts[-1])
+        yield _closed_bins(bins[:-1], sums[:-1], counts[:-1])
+
+    if held:
+        yield _frame(held[0][0], held[0][1])
+    elif carry is not None:
+        yield _closed_bins(np.array([carry[0]]), carry[1][None, :], carry[2][None, :])
+
+
+def _closed_bins(bins, sums, counts) -> pd.DataFrame:
+    # Bins where any column had no valid sample are dropped, like resample().mean().dropna()
+    keep = (counts > 0).all(axis=1)
+    return _frame(bins[keep] * CADENCE_NS, sums[keep] / counts[keep])
+
+
+def _frame(ts: np.ndarray, values: np.ndarray) -> pd.DataFrame:
+    df = pd.DataFrame(values, columns=[RENAMED[col] for col in RAW_COLUMNS])
+    df.insert(0, "timestamp", pd.to_datetime(ts))
+    return df
+
+
+def iter_feature_samples(resampled):
+    """
+    Takes 5-minute frames in time order and yields their per-sample feature
+    frames (see compute_feature_columns), each row exactly once. Only 2 raw
+    rows are carried between frames, for the centered Vp std.
+    """
+
+    tail = None         # last raw rows; the last one still needs its right neighbour
+    for frame in resampled:
+        if frame.empty:
+            continue
+        rows = frame if tail is None else pd.concat([tail, frame], ignore_index=True)
+        emitted = 0 if tail is None else len(tail) - 1
+        samples = compute_feature_columns(rows.copy()).iloc[emitted:-1]
+        tail = rows.iloc[-2:]
+        if len(samples):
+            yield samples
+
+    if tail is not None:
+        # The final row's centered std is undefined, as in the batch path
+        yield compute_feature_columns(tail.copy()).iloc[-1:]
+
+
+def iter_window_features(samples, window="3h", stride="5min", min_samples: int = 1):
+    """
+    Takes per-sample feature frames in time order and yields the same
+    windows as extract_rolling_features, a batch at a time. Only the samples
+    that still fall inside an open window are kept.
+    """
+
+    window = pd.Timedelta(window)
+    stride = pd.Timedelta(stride)
+    if window <= pd.Timedelta(0) or stride <= pd.Timedelta(0):
+        raise ValueError("Window length and stride must both be positive.")
+
+    buffer = None
+    first_ts = next_start = last_ts = None
+
+    for frame in samples:
+        if frame.empty:
+            continue
+        if first_ts is None:
+            first_ts = next_start = frame["timestamp"].iloc[0].value
+        last_ts = frame["timestamp"].iloc[-1].value
+        buffer = frame if buffer is None else pd.concat([buffer, frame], ignore_index=True)
+
+        # Later samples are strictly newer, so every sample before last_ts + 1ns is in
+        starts = window_starts(next_start, last_ts + 1 - window.value, stride)
+        if len(starts):
+            yield rolling_window_means(buffer, starts, window, min_samples)
+            next_start = int(starts[-1]) + stride.value
+            buffer = buffer[buffer["timestamp"] >= pd.Timestamp(next_start)]
+
+    if buffer is None:
+        return
+    last_start = max(first_ts, last_ts + CADENCE_NS - window.value)
+    starts = window_starts(next_start, last_start, stride)
+    if len(starts):
+        yield rolling_window_means(buffer, starts, window, min_samples)
+
+
+def iter_rolling_features(resampled, window="3h", stride="5min", min_samples: int = 1):
+    """
+    Takes 5-minute frames in time order and yields the same windows as
+    extract_rolling_features, a batch at a time, without holding the series.
+    """
+
+    yield from iter_window_features(iter_feature_samples(resampled), window, stride, min_samples)
+
+
+def score_csv_stream(model, source, window="3h", stride="5min", threshold: float = None,
+                     chunksize: int = 500_000, fmt: str = "csv"):
+    """
+    Scores a SWIS file of any size chunk by chunk (CSV, or Parquet/Feather
+    with `fmt`). Yields probability timeline frames (see score_timeline) in
+    time order; peak memory is bounded by `chunksize` and the window length,
+    not by the file size.
+    """
+
+    resampled = iter_resampled_chunks(read_chunks(source, fmt, chunksize))
+    for timeline in iter_rolling_features(resampled, window=window, stride=stride):
+        yield score_windows(model, timeline, threshold)
@@ -0,0 +1,220 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# "off" (default), "on" for timers and row counts, "memory" to also trace allocations
+METRICS_MODES = ("off", "on", "memory")
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_stats = {}  # stage -> {"count", "seconds", "rows", "alloc_bytes", "peak_bytes", "buckets"}
+_enabled = False
+_owns_tracing = False  # whether set_mode("memory") started tracemalloc
+_trace = contextvars.ContextVar("pipeline_trace", default=None)
+_local = threading.local()  # per-thread stack of open stages' [start, peak] traced memory
+
+
+class _NoopStage:
+    """Returned by stage() when nothing is recording; every operation is a no-op."""
+
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NOOP = _NoopStage()
+
+
+class _Stage:
+    __slots__ = ("name", "rows", "_t0", "_mem")
+
+    def __init__(self, name: str, rows):
+        self.name = name
+        self.rows = rows
+        self._mem = None
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            stack = _mem_stack()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)  # the enclosing stage's peak so far
+            tracemalloc.reset_peak()
+            self._mem = [current, current]
+            stack.append(self._mem)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._t0
+        alloc = peak = None
+        if self._mem is not None and tracemalloc.is_tracing():
+            current, traced_peak = tracemalloc.get_traced_memory()
+            stack = _mem_stack()
+            stack.pop()
+            top = max(self._mem[1], traced_peak)
+            if stack:
+                stack[-1][1] = max(stack[-1][1], top)
+            alloc, peak = current - self._mem[0], top - self._mem[0]
+        _record(self.name, self._t0, seconds, self.rows, alloc, peak)
+        return False
+
+
+def _mem_stack() -> list:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _record(name: str, started: float, seconds: float, rows, alloc, peak):
+    records = _trace.get()
+    if records is not None:
+        records.append({"stage": name, "started": started, "ms": seconds * 1000, "rows": rows,
+                        "alloc_kb": None if alloc is None else alloc / 1024,
+                        "peak_kb": None if peak is None else peak / 1024})
+    if not _enabled:
+        return
+    with _lock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = {"count": 0, "seconds": 0.0, "rows": 0, "alloc_bytes": 0, "peak_bytes": 0,
+                                    "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["rows"] += rows or 0
+        entry["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if alloc is not None:
+            entry["alloc_bytes"] += alloc
+            entry["peak_bytes"] = max(entry["peak_bytes"], peak)
+
+
+def stage(name: str, rows: int = None):
+    """
+    Times the enclosed block as pipeline stage `name`:
+
+        with stage("resample", len(df)) as s:
+            ...
+            s.rows = len(result)  # or set the row count once known
+
+    Records to the process-wide metrics when PIPELINE_METRICS is on, and to
+    the active trace() if there is one. Otherwise it returns a shared no-op
+    context, so instrumented code costs one function call. Nested stages
+    are timed inclusively.
+    """
+    if not _enabled and _trace.get() is None:
+        return _NOOP
+    return _Stage(name, rows)
+
+
+@contextmanager
+def trace(memory: bool = False):
+    """
+    Collects the stages run inside the block, in the current thread or
+    task only, into the yielded list of {stage, started, ms, rows,
+    alloc_kb, peak_kb} records, in the order the stages finished
+    (`started` is a time.perf_counter() value). Works whether or not process-wide metrics are on.
+    `memory` traces allocations for the duration, which slows the stages down.
+    """
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    records = []
+    token = _trace.set(records)
+    try:
+        yield records
+    finally:
+        _trace.reset(token)
+        if started:
+            tracemalloc.stop()
+
+
+def set_mode(mode: str):
+    """Switches process-wide metrics to "off", "on" or "memory" (see PIPELINE_METRICS)."""
+    global _enabled, _owns_tracing
+    if mode not in METRICS_MODES:
+        raise ValueError(f"Unknown metrics mode: {mode}. Expected one of {', '.join(METRICS_MODES)}.")
+    _enabled = mode != "off"
+    if mode == "memory" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _owns_tracing = True
+    elif mode != "memory" and _owns_tracing:
+        tracemalloc.stop()
+        _owns_tracing = False
+
+
+def metrics_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    """Clears the process-wide stage metrics."""
+    with _lock:
+        _stats.clear()
+
+
+def snapshot() -> dict:
+    """Returns a copy of the process-wide metrics, keyed by stage."""
+    with _lock:
+        return {name: {**entry, "buckets": list(entry["buckets"])} for name, entry in _stats.items()}
+
+
+def format_metric(name: str, kind: str, help_text: str, samples) -> str:
+    """
+    Formats one metric in the Prometheus text exposition format. `samples`
+    is a single value or a {label string: value} dict, e.g.
+    {'stage="parse"': 3}.
+    """
+    if not isinstance(samples, dict):
+        samples = {"": samples}
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples.items():
+        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def render_prometheus(prefix: str = "cme") -> str:
+    """Returns the per-stage metrics in the Prometheus text exposition format."""
+    stats = snapshot()
+    out = [format_metric(f"{prefix}_pipeline_metrics_enabled", "gauge",
+                         "Whether per-stage pipeline metrics are being recorded.", int(_enabled))]
+    if not stats:
+        return "".join(out)
+
+    histogram = [f"# HELP {prefix}_stage_seconds Time spent in each pipeline stage.",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+    for name, entry in sorted(stats.items()):
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), entry["buckets"]):
+            cumulative += count
+            histogram.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+        histogram.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {entry["seconds"]}')
+        histogram.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {entry["count"]}')
+    out.append("\n".join(histogram) + "\n")
+
+    def labelled(key):
+        return {f'stage="{name}"': entry[key] for name, entry in sorted(stats.items())}
+
+    out.append(format_metric(f"{prefix}_stage_rows_total", "counter", "Rows processed by each stage.",
+                             labelled("rows")))
+    if tracemalloc.is_tracing():
+        out.append(format_metric(f"{prefix}_stage_alloc_bytes_total", "counter",
+                                 "Net traced bytes allocated by each stage.", labelled("alloc_bytes")))
+        out.append(format_metric(f"{prefix}_stage_peak_alloc_bytes", "gauge",
+                                 "Largest traced allocation peak within one run of each stage.",
+                                 labelled("peak_bytes")))
+    return "".join(out)
+
+
+set_mode(os.getenv("PIPELINE_METRICS", "off"))
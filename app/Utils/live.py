@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+from app.Utils.calibration import DEFAULT_THRESHOLD, load_threshold
+from app.Utils.features import RAW_COLUMNS, parse_timestamps
+from app.Utils.model_registry import MODEL_PATH, get_compiled_model, get_model, get_model_version, resolve_model
+from app.Utils.streaming import StreamingFeatureExtractor
+
+THRESHOLD = DEFAULT_THRESHOLD
+
+
+def parse_record(fields: dict) -> dict:
+    """
+    Takes one raw record (a CSV row or JSON object as a dict of strings or
+    numbers) and returns a sample with a parsed timestamp and float plasma
+    columns. Missing or empty values become NaN; raises ValueError for an
+    unreadable timestamp or value.
+    """
+
+    ts = pd.Timestamp(fields.get("timestamp")) if fields.get("timestamp") not in (None, "") else pd.NaT
+    if pd.isna(ts):
+        raise ValueError(f"Invalid timestamp: {fields.get('timestamp')!r}")
+    record = {"timestamp": ts}
+    for col in RAW_COLUMNS:
+        value = fields.get(col)
+        record[col] = math.nan if value in (None, "") else float(value)
+    return record
+
+
+async def replay_source(path: str, speedup: float = 60.0):
+    """
+    Plays a debug_input.csv-style file as a live feed: yields its samples
+    in time order, spaced by their timestamps divided by `speedup` (0 for
+    as fast as possible). Each item is (sample, loop time it was emitted).
+    """
+
+    df = pd.read_csv(path, usecols=["timestamp", *RAW_COLUMNS])
+    df["timestamp"] = parse_timestamps(df["timestamp"])
+    df = df.dropna(subset=["timestamp"]).sort_values("timestamp", kind="stable")
+    if df.empty:
+        return
+
+    loop = asyncio.get_running_loop()
+    offsets = (df["timestamp"] - df["timestamp"].iloc[0]).dt.total_seconds().to_numpy()
+    started = loop.time()
+    for offset, sample in zip(offsets, df.to_dict("records")):
+        if speedup:
+            delay = started + offset / speedup - loop.time()
+            await asyncio.sleep(max(delay, 0))
+        else:
+            await asyncio.sleep(0)  # let other tasks run between samples
+        yield sample, loop.time()
+
+
+def _read_appended(files: dict, path: str, pattern: str, max_bytes: int):
+    # One poll of tail_directory, run in a worker thread: returns the samples
+    # in what was appended since the last poll (at most max_bytes per file)
+    # and whether any file has more left to read
+    samples, more = [], False
+    for name in sorted(glob.glob(os.path.join(path, pattern))):
+        state = files.setdefault(name, [0, None, b""])
+        size = os.path.getsize(name)
+        if size <= state[0]:
+            continue
+        with open(name, "rb") as f:
+            f.seek(state[0])
+            data = f.read(max_bytes)
+            state[0] = f.tell()
+        more = more or state[0] < size
+        lines = (state[2] + data).split(b"\n")
+        state[2] = lines.pop()
+        for line in lines:
+            line = line.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            if state[1] is None:
+                state[1] = [field.strip() for field in line.split(",")]
+                continue
+            try:
+                samples.append(parse_record(dict(zip(state[1], line.split(",")))))
+            except ValueError:
+                continue
+    return samples, more
+
+
+async def tail_directory(path: str, pattern: str = "*.csv", poll: float = 1.0, max_bytes: int = 1 << 20):
+    """
+    Follows CSV files in a directory like `tail -f`: rows appended to any
+    file matching `pattern`, and files created later, are yielded as
+    (sample, loop time it was read). Each file's first line is its header;
+    a partly written last line waits for the next poll. Unreadable rows
+    are skipped. Listing, reading and parsing run in a worker thread, at
+    most `max_bytes` per file per poll, so a large backlog never blocks the
+    event loop. Runs until cancelled.
+    """
+
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"No such directory: {path}")
+    loop = asyncio.get_running_loop()
+    files = {}  # path -> [offset, header, partial line (bytes)]
+    while True:
+        samples, more = await asyncio.to_thread(_read_appended, files, path, pattern, max_bytes)
+        for sample in samples:
+            yield sample, loop.time()
+        if not samples and not more:
+            await asyncio.sleep(poll)
+
+
+async def socket_source(address: str):
+    """
+    Listens on a local socket for newline-delimited JSON samples and yields
+    them as (sample, loop time received). `address` is host:port for TCP
+    or a filesystem path for a Unix socket. Malformed lines are skipped.
+    Runs until cancelled.
+    """
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=10_000)
+
+    async def handle(reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    sample = parse_record(json.loads(line))
+                except (ValueError, TypeError):
+                    continue
+                await queue.put((sample, loop.time()))
+        finally:
+            writer.close()
+
+    if ":" in address and os.path.sep not in address:
+        host, port = address.rsplit(":", 1)
+        server = await asyncio.start_server(handle, host, int(port))
+    else:
+        server = await asyncio.start_unix_server(handle, address)
+    async with server:
+        while True:
+            yield await queue.get()
+
+
+def source_from_spec(spec: str, speedup: float = 60.0, pattern: str = "*.csv"):
+    """
+    Opens a source from a "kind:target" string, for configuring a feed in
+    one setting: replay:FILE, watch:DIR or listen:ADDRESS (host:port or a
+    Unix socket path).
+    """
+
+    kind, _, target = spec.partition(":")
+    if not target:
+        raise ValueError(f"Invalid live source {spec!r}; expected replay:FILE, watch:DIR or listen:ADDRESS.")
+    if kind == "replay":
+        return replay_source(target, speedup)
+    if kind == "watch":
+        return tail_directory(target, pattern)
+    if kind == "listen":
+        return socket_source(target)
+    raise ValueError(f"Unknown live source kind: {kind!r}")
+
+
+class AlertBus:
+    """
+    Fans published messages out to asyncio subscribers. Each subscriber has
+    a bounded queue; when it falls behind, its oldest messages are dropped
+    rather than blocking the detector. `latest` keeps the most recent
+    message of each type, for clients that connect mid-stream.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self.latest = {}
+        self._queues = set()
+
+    def __len__(self):
+        return len(self._queues)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.maxsize)
+        self._queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._queues.discard(queue)
+
+    def publish(self, message: dict):
+        self.latest[message["type"]] = message
+        for queue in self._queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+
+class LiveDetector:
+    """
+    Scores a live feed of raw SWIS samples.
+
+    Samples go into a StreamingFeatureExtractor over the last `window`, one
+    at a time. The model is called once per 5-minute bin, when the first
+    sample of the next bin closes it, and in a worker thread so the event
+    loop keeps reading. Each score is published on `bus` as a "probability"
+    message; crossing `threshold` upwards or back down also publishes an
+    "alert" (cme_onset / cme_end). `model` may be a loader (e.g. get_model),
+    resolved at every score.
+    """
+
+    def __init__(self, model, window="3h", threshold: float = THRESHOLD, bus: AlertBus = None, monitor=None):
+        self.model = model
+        self.threshold = threshold
+        self.bus = bus if bus is not None else AlertBus()
+        self.extractor = StreamingFeatureExtractor(window=window, monitor=monitor)
+        self.above = False
+        self.records = self.skipped = self.scores = self.alerts = 0
+        self.error = None  # why the source failed, once it has
+        # seconds from the sample that closed a bin to its score being published, for the most recent scores
+        self.latencies = deque(maxlen=100_000)
+
+    async def run(self, source):
+        """
+        Consumes (sample, received) pairs from an async source until it
+        ends. If the source fails, `error` describes why, a "source_error"
+        message goes out on the bus, and the exception is re-raised.
+        """
+        try:
+            await self._consume(source)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.bus.publish({"type": "source_error", "error": self.error})
+            raise
+
+    async def _consume(self, source):
+        async for sample, received in source:
+            previous = self.extractor.current_bin
+            try:
+                self.extractor.update(sample)
+            except ValueError:
+                self.skipped += 1  # out of order
+                continue
+            self.records += 1
+            if previous is not None and self.extractor.current_bin != previous:
+                await self.score(previous, received)
+
+    async def score(self, closed_bin, received: float):
+        prob = await asyncio.to_thread(self.extractor.predict_proba, resolve_model(self.model), False)
+        loop = asyncio.get_running_loop()
+        self.scores += 1
+        probability = None if math.isnan(prob) else prob
+        self.bus.publish({"type": "probability", "timestamp": closed_bin.isoformat(), "probability": probability,
+                          "n_samples": self.extractor.n_samples})
+
+        above = probability is not None and probability >= self.threshold
+        if above != self.above:
+            self.above = above
+            self.alerts += 1
+            self.bus.publish({"type": "alert", "event": "cme_onset" if above else "cme_end",
+                              "timestamp": closed_bin.isoformat(), "probability": probability,
+                              "threshold": self.threshold})
+        self.latencies.append(loop.time() - received)
+
+    def stats(self, elapsed: float) -> dict:
+        """Returns record and score counts, throughput and score latency percentiles (ms)."""
+        latencies = np.asarray(self.latencies) * 1000
+        return {
+            "records": self.records,
+            "skipped": self.skipped,
+            "scores": self.scores,
+            "alerts": self.alerts,
+            "elapsed_s": elapsed,
+            "records_per_s": self.records / elapsed if elapsed else float("nan"),
+            "latency_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else float("nan"),
+            "latency_p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else float("nan"),
+            "latency_max_ms": float(latencies.max()) if len(latencies) else float("nan"),
+        }
+
+
+async def _print_alerts(queue: asyncio.Queue, alerts_file: str = None, verbose: bool = False):
+    out = open(alerts_file, "a") if alerts_file else None
+    try:
+        while True:
+            message = await queue.get()
+            if message["type"] == "alert" or verbose:
+                print(json.dumps(message), flush=True)
+            if out is not None and message["type"] == "alert":
+                out.write(json.dumps(message) + "\n")
+                out.flush()
+    finally:
+        if out is not None:
+            out.close()
+
+
+async def serve(source, model, window="3h", threshold: float = THRESHOLD, alerts_file: str = None,
+                verbose: bool = False) -> dict:
+    """Runs a LiveDetector on `source`, printing alerts, and returns its stats once the source ends."""
+    detector = LiveDetector(model, window=window, threshold=threshold)
+    queue = detector.bus.subscribe()
+    printer = asyncio.create_task(_print_alerts(queue, alerts_file, verbose))
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        await detector.run(source)
+        while not queue.empty() and not printer.done():
+            await asyncio.sleep(0)  # let the printer drain what is queued
+    finally:
+        printer.cancel()
+    return detector.stats(loop.time() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a live SWIS feed and publish CME alerts.")
+    feed = parser.add_mutually_exclusive_group(required=True)
+    feed.add_argument("--replay", help="CSV file to play back as a live feed")
+    feed.add_argument("--watch", help="directory of CSV files to follow")
+    feed.add_argument("--listen", help="host:port or Unix socket path for newline-delimited JSON samples")
+    parser.add_argument("--speedup", type=float, default=60.0, help="replay speed factor (0: as fast as possible)")
+    parser.add_argument("--pattern", default="*.csv", help="file pattern for --watch")
+    parser.add_argument("--window", default="3h")
+    parser.add_argument("--threshold", type=float, help="default: the calibrated threshold for the model")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--backend", choices=["sklearn", "compiled"], default="sklearn")
+    parser.add_argument("--alerts-file", help="append alerts to this JSONL file")
+    parser.add_argument("--verbose", action="store_true", help="print every probability, not only alerts")
+    args = parser.parse_args(argv)
+
+    model = get_compiled_model(args.model) if args.backend == "compiled" else get_model(args.model)
+    threshold = args.threshold if args.threshold is not None else load_threshold(get_model_version(args.model))
+    if args.replay:
+        source = replay_source(args.replay, args.speedup)
+    elif args.watch:
+        source = tail_directory(args.watch, args.pattern)
+    else:
+        source = socket_source(args.listen)
+
+    try:
+        stats = asyncio.run(serve(source, model, args.window, threshold, args.alerts_file, args.verbose))
+    except KeyboardInterrupt:
+        return
+    print(json.dumps(stats, indent=1))
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.live --replay debug_input.csv --speedup 0
+    main()
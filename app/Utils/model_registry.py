@@ -0,0 +1,153 @@
+import argparse
+import os
+import tempfile
+import threading
+import joblib
+import pyarrow.parquet as pq
+from app.Utils.cache import file_fingerprint
+from app.Utils.compiled_model import CompiledEnsemble, compile_ensemble
+
+MODEL_PATH = "app/model/cme_model.joblib"
+
+# Directory of memory-mapped compiled arrays exported by the pre-fork step
+# (see export_shared). Workers that find an export of the current model there
+# map it instead of unpickling and compiling their own copy.
+SHARED_MODEL_DIR = os.getenv("SHARED_MODEL_DIR")
+VERSION_FILE = "VERSION"
+# Parquet schema metadata key naming the model version that scored a timeline
+MODEL_VERSION_KEY = b"cme_model_version"
+
+_lock = threading.Lock()
+_models = {}  # path -> {"stamp", "version", and "model" / "compiled" once loaded}
+
+
+def default_shared_dir() -> str:
+    """Returns a directory for export_shared: tmpfs (/dev/shm) when available, else the temp dir."""
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, "cme_model")
+
+
+def _entry(path: str) -> dict:
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    entry = _models.get(path)
+    if entry is not None and entry["stamp"] == stamp:
+        return entry
+
+    with _lock:
+        entry = _models.get(path)
+        if entry is None or entry["stamp"] != stamp:
+            entry = _models[path] = {"stamp": stamp, "version": file_fingerprint(path)}
+        return entry
+
+
+def _attach_shared(version: str, directory: str = None):
+    # Returns the mapped CompiledEnsemble when `directory` holds an export of this model version
+    directory = directory or SHARED_MODEL_DIR
+    if not directory:
+        return None
+    try:
+        with open(os.path.join(directory, VERSION_FILE)) as f:
+            if f.read().strip() != version:
+                return None
+    except FileNotFoundError:
+        return None
+    return CompiledEnsemble.load_dir(directory, mmap_mode="r")
+
+
+def get_model(path: str = MODEL_PATH):
+    """
+    Returns the model stored at `path`, loading it at most once per process.
+
+    The file is re-read only when its modification time or size changes, so
+    Streamlit reruns and concurrent requests share one read-only instance.
+    Treat the returned object as read-only.
+    """
+    entry = _entry(path)
+    if "model" not in entry:
+        with _lock:
+            if "model" not in entry:
+                # mmap_mode maps large NumPy arrays (e.g. tree node tables) read-only
+                # from the file, so every process that loads the model shares the same pages
+                entry["model"] = joblib.load(path, mmap_mode="r")
+    return entry["model"]
+
+
+def get_compiled_model(path: str = MODEL_PATH):
+    """
+    Returns the NumPy-only CompiledEnsemble for the model at `path`,
+    compiled on first use and rebuilt whenever the model file changes.
+
+    When SHARED_MODEL_DIR holds an export of the same model version, its
+    arrays are memory-mapped instead: the process never unpickles the model
+    (nor imports sklearn or xgboost), and all workers share one copy.
+    """
+    entry = _entry(path)
+    if "compiled" not in entry:
+        shared = _attach_shared(entry["version"])
+        model = get_model(path) if shared is None else None
+        with _lock:
+            if "compiled" not in entry:
+                entry["compiled"] = shared if shared is not None else compile_ensemble(model)
+    return entry["compiled"]
+
+
+def get_model_version(path: str = MODEL_PATH) -> str:
+    """Returns the content fingerprint of the model file, without loading it."""
+    return _entry(path)["version"]
+
+
+def resolve_model(model):
+    """
+    Returns `model` itself, or the current model when it is a loader such as
+    get_model or get_compiled_model. Long-lived scorers hold the loader and
+    resolve it per call, so they pick up a replaced model file.
+    """
+    return model if hasattr(model, "predict_proba") else model()
+
+
+def with_model_version(schema, version: str):
+    """Returns the Arrow `schema` tagged with the model version that scored the timeline (see timeline_model_version)."""
+    return schema.with_metadata({**(schema.metadata or {}), MODEL_VERSION_KEY: version.encode()})
+
+
+def timeline_model_version(path: str):
+    """Returns the model version a timeline Parquet file was scored with, or None if it does not record one."""
+    version = (pq.read_schema(path).metadata or {}).get(MODEL_VERSION_KEY)
+    return None if version is None else version.decode()
+
+
+def export_shared(path: str = MODEL_PATH, directory: str = None) -> str:
+    """
+    Compiles the model at `path` and writes its arrays to `directory` as
+    .npy files, tagged with the model version, for get_compiled_model in
+    worker processes to map. Run it once in the parent before starting
+    the workers. Returns the directory.
+    """
+    directory = directory or SHARED_MODEL_DIR or default_shared_dir()
+    compiled = compile_ensemble(joblib.load(path))
+    try:
+        os.remove(os.path.join(directory, VERSION_FILE))  # workers starting mid-export compile their own
+    except FileNotFoundError:
+        pass
+    compiled.save_dir(directory)
+    tmp = os.path.join(directory, f".{VERSION_FILE}.tmp")
+    with open(tmp, "w") as f:
+        f.write(file_fingerprint(path))
+    os.replace(tmp, os.path.join(directory, VERSION_FILE))
+    return directory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the compiled model to shared memory for worker processes.")
+    parser.add_argument("directory", nargs="?", help="output directory (default: SHARED_MODEL_DIR or /dev/shm/cme_model)")
+    parser.add_argument("--model", default=MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    directory = export_shared(args.model, args.directory)
+    print(f"Exported {args.model} ({get_model_version(args.model)}) -> {directory}")
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.model_registry /dev/shm/cme_model
+    main()
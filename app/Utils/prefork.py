@@ -0,0 +1,101 @@
+import argparse
+import gc
+import importlib
+import os
+import signal
+import socket
+import uvicorn
+
+
+def load_app(target: str):
+    """Imports "module:attribute" (e.g. main:app) and returns the attribute."""
+    module, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module), attribute or "app")
+
+
+def _run_worker(app, sock: socket.socket, log_level: str):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on"))
+    server.run(sockets=[sock])
+
+
+def serve(target: str = "main:app", host: str = "0.0.0.0", port: int = 10000, workers: int = 2,
+          log_level: str = "info"):
+    """
+    Pre-fork server: imports the app (and so loads the model) once in this
+    process, then forks `workers` uvicorn servers that accept on one shared
+    socket. The imported modules and the loaded model are inherited
+    copy-on-write instead of being rebuilt per worker, and gc.freeze() keeps
+    the collector from touching, and so copying, those pages. Workers that
+    exit are replaced; SIGTERM or SIGINT stops them all.
+
+    Refuses to start more than one worker with LIVE_SOURCE set: each would
+    run its own live loop (see main.py).
+    """
+
+    if os.getenv("LIVE_SOURCE") and workers > 1:
+        raise ValueError("LIVE_SOURCE needs a single worker; run the live feed with --workers 1.")
+
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    app = load_app(target)
+    gc.collect()
+    gc.freeze()
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, sock, log_level)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    print(f"Serving {target} on {host}:{port} with {workers} forked workers (master pid {os.getpid()})", flush=True)
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited; starting a new one", flush=True)
+            spawn()
+    sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the app from forked workers that share one loaded model.")
+    parser.add_argument("target", nargs="?", default="main:app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", 2)))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    serve(args.target, args.host, args.port, args.workers, args.log_level)
+
+
+if __name__ == "__main__":
+    # python -m app.Utils.prefork main:app --workers 4 --port 10000
+    main()
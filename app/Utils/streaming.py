@@ -0,0 +1,166 @@
+from collections import deque
+import math
+import pandas as pd
+import numpy as np
+from app.Utils.features import CADENCE, FEATURE_COLUMNS, MAX_NEIGHBOUR_GAP_NS, RAW_COLUMNS
+
+
+def _ratio(num: float, den: float) -> float:
+    if den == 0 or math.isnan(den):
+        return math.nan
+    value = num / den
+    return value if math.isfinite(value) else math.nan
+
+
+class StreamingFeatureExtractor:
+    """
+    Incremental version of extract_features_from_window for live SWIS samples.
+
+    Samples are fed in time order, one at a time or in small batches. Samples
+    falling in the same 5-minute bin are averaged, matching the batch
+    resampler. Closed bins go through a 3-bin ring buffer that gives the
+    centered `vp_std_15min` of the middle bin, unless a data gap separates
+    it from a neighbour (see rolling_vp_std). Running sums then hold the
+    whole-history mean of the 4 features, or with `window`, the mean over
+    the samples in the last `window` up to the newest one with a feature
+    value (as rolling_window_means would give for that window).
+
+    Every update costs O(1) time, and O(1) memory without a window, whatever
+    the stream length. A DriftMonitor passed as `monitor` gets each sample's
+    raw means and features as the sample's features are computed.
+    """
+
+    def __init__(self, window=None, monitor=None):
+        self.window = None if window is None else pd.Timedelta(window)
+        self.monitor = monitor
+        self._ring = deque(maxlen=3)   # closed bins as (bin start, (Np, Vp, Tp, Alpha))
+        self._sums = [0.0] * len(FEATURE_COLUMNS)
+        self._count = 0
+        self._in_window = deque()      # (sample time, contribution) still inside the window
+        self._bin = None               # start of the 5-minute bin being filled
+        self._bin_sums = [0.0] * len(RAW_COLUMNS)
+        self._bin_counts = [0] * len(RAW_COLUMNS)
+        self.last_timestamp = None
+
+    @property
+    def n_samples(self) -> int:
+        """Number of 5-minute samples that currently contribute to the means."""
+        return self._count
+
+    @property
+    def current_bin(self):
+        """Start of the 5-minute bin being filled, or None before the first sample."""
+        return self._bin
+
+    def update(self, sample) -> "StreamingFeatureExtractor":
+        """
+        Takes one raw sample (a mapping with timestamp and the 4 plasma columns).
+
+        Raises ValueError if the sample is older than the bin being filled.
+        """
+
+        ts = pd.Timestamp(sample["timestamp"])
+        if pd.isna(ts):
+            return self
+        bin_start = ts.floor(CADENCE)
+
+        if self._bin is not None and bin_start < self._bin:
+            raise ValueError(f"Samples must arrive in time order (got {ts} after {self.last_timestamp}).")
+        if self._bin is not None and bin_start > self._bin:
+            self._close_bin()
+
+        self._bin = bin_start
+        for i, col in enumerate(RAW_COLUMNS):
+            value = float(sample[col])
+            if not math.isnan(value):
+                self._bin_sums[i] += value
+                self._bin_counts[i] += 1
+        self.last_timestamp = ts
+        return self
+
+    def update_batch(self, df: pd.DataFrame) -> "StreamingFeatureExtractor":
+        """Takes a small DataFrame of raw samples and feeds them in time order."""
+        df = df.assign(timestamp=pd.to_datetime(df["timestamp"], errors="coerce"))
+        for sample in df.dropna(subset=["timestamp"]).sort_values("timestamp").to_dict("records"):
+            self.update(sample)
+        return self
+
+    def features(self, include_pending: bool = True) -> pd.DataFrame:
+        """
+        Returns the current 1-row feature frame, same layout as
+        extract_features_from_window. Unless `include_pending` is False, the
+        bin still being filled is included as if it were closed.
+        """
+
+        sums, count = list(self._sums), self._count
+        pending = self._pending_bin() if include_pending else None
+        if pending is not None and len(self._ring) >= 2:
+            contribution = self._middle_features(self._ring[-2], self._ring[-1], (self._bin, pending))
+            if contribution is not None:
+                sums = [s + c for s, c in zip(sums, contribution)]
+                count += 1
+
+        if count == 0:
+            return pd.DataFrame([dict.fromkeys(FEATURE_COLUMNS, np.nan)])
+        return pd.DataFrame([{name: s / count for name, s in zip(FEATURE_COLUMNS, sums)}])
+
+    def predict_proba(self, model, include_pending: bool = True) -> float:
+        """Returns the CME probability for everything seen so far, or NaN without enough data."""
+        features_df = self.features(include_pending)
+        if features_df.isnull().values.any():
+            return math.nan
+        return float(model.predict_proba(features_df)[0][1])
+
+    def _pending_bin(self):
+        if self._bin is None or 0 in self._bin_counts:
+            return None
+        return tuple(s / c for s, c in zip(self._bin_sums, self._bin_counts))
+
+    def _close_bin(self):
+        closed = self._pending_bin()
+        self._bin_sums = [0.0] * len(RAW_COLUMNS)
+        self._bin_counts = [0] * len(RAW_COLUMNS)
+        if closed is None:
+            return  # an incomplete bin is dropped, like resample().mean().dropna()
+
+        self._ring.append((self._bin, closed))
+        if len(self._ring) == 3:
+            contribution = self._middle_features(*self._ring)
+            if self.monitor is not None:
+                self.monitor.update_one((*self._ring[1][1], *(contribution or [math.nan] * len(FEATURE_COLUMNS))))
+            if contribution is not None:
+                self._sums = [s + c for s, c in zip(self._sums, contribution)]
+                self._count += 1
+                if self.window is not None:
+                    self._slide(self._ring[1][0], contribution)
+
+    def _slide(self, sample_time, contribution):
+        # Drops the samples that fell out of the window ending at sample_time
+        self._in_window.append((sample_time, contribution))
+        while self._in_window[0][0] <= sample_time - self.window:
+            _, old = self._in_window.popleft()
+            self._sums = [s - c for s, c in zip(self._sums, old)]
+            self._count -= 1
+        if self._count == 1:
+            self._sums = list(contribution)  # resync, so subtraction error cannot build up
+
+    @staticmethod
+    def _middle_features(prev, mid, nxt):
+        # Each argument is a (bin start, bin means) pair
+        if (mid[0] - prev[0]).value > MAX_NEIGHBOUR_GAP_NS or (nxt[0] - mid[0]).value > MAX_NEIGHBOUR_GAP_NS:
+            return None
+        np_, vp, tp, alpha = mid[1]
+        a, c = prev[1][1], nxt[1][1]
+        # Pairwise form, as in rolling_vp_std: exactly 0 for equal speeds
+        vp_std = math.sqrt(((a - vp) ** 2 + (vp - c) ** 2 + (a - c) ** 2) / 6)
+
+        alpha_proton_ratio = _ratio(alpha, np_)
+        values = (
+            alpha_proton_ratio,
+            vp_std if math.isfinite(vp_std) else math.nan,
+            _ratio(alpha_proton_ratio, vp_std),
+            _ratio(alpha, tp),
+        )
+        if any(math.isnan(v) for v in values):
+            return None
+        return values
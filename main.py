@@ -1,69 +1,425 @@
-# from fastapi import FastAPI, Request, UploadFile, File
-# from fastapi.responses import HTMLResponse
-# from fastapi.staticfiles import StaticFiles
-# from fastapi.templating import Jinja2Templates
-# import joblib
-# import pandas as pd
-# from io import StringIO
-# from app.Utils.features import extract_features_from_window
-
-# app = FastAPI()
-# app.mount("/static", StaticFiles(directory="static"), name="static")
-# templates = Jinja2Templates(directory="app/templates")
-
-# model = joblib.load("app/model/cme_model.joblib")
-# THRESHOLD = 0.45
-
-# @app.get("/", response_class=HTMLResponse)
-# async def home(request: Request):
-#     return templates.TemplateResponse("index.html", {"request": request})
-
-# @app.post("/predict", response_class=HTMLResponse)
-# async def predict(request: Request, file: UploadFile = File(...)):
-#     try:
-#         contents = await file.read()
-#         df = pd.read_csv(StringIO(contents.decode("utf-8")))
-
-#         # Save file for debugging
-#         df.to_csv("debug_input.csv", index=False)
-
-#         # Validate required columns
-#         required_cols = {"proton_density", "proton_speed", "proton_temperature", "alpha_density"}
-#         if not required_cols.issubset(set(df.columns)):
-#             raise ValueError("Missing required columns: " + ", ".join(required_cols - set(df.columns)))
-
-#         # Check time resolution
-#         if "timestamp" in df.columns:
-#             df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-#             df = df.sort_values("timestamp")
-#             time_deltas = df["timestamp"].diff().dropna().dt.total_seconds()
-#             if not (time_deltas.between(240, 360).mean() > 0.75):
-#                 raise ValueError("Time resolution not close to 5 minutes. Please average your data.")
-
-#         # Feature extraction
-#         features_df = extract_features_from_window(df)
-#         if features_df.isnull().values.any():
-#             raise ValueError("Feature extraction failed. Ensure enough valid data is present (~15 min).")
-
-#         # Prediction
-#         prob = model.predict_proba(features_df)[0][1]
-#         prediction = int(prob >= THRESHOLD)
-#         result = "CME" if prediction else "Non-CME"
-
-#         # Pass preview rows (first 5 rows)
-#         preview_rows = df.head(5)
-
-#         return templates.TemplateResponse("index.html", {
-#             "request": request,
-#             "submitted": True,
-#             "result": result,
-#             "confidence": round(prob * 100, 2),
-#             "preview_rows": preview_rows.to_html(classes="preview-table", index=False, border=0, escape=False)
-#         })
-
-#     except Exception as e:
-#         return templates.TemplateResponse("index.html", {
-#             "request": request,
-#             "submitted": True,
-#             "error": str(e)
-#         })
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+import traceback
+from fastapi import FastAPI, Request, UploadFile, File, HTTPException
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+import pandas as pd
+from io import BytesIO
+from app.Utils.features import CADENCE_NS, compute_feature_columns, prepare_window, window_feature_means
+from app.Utils.inference import predict_batch, split_labeled_windows
+from app.Utils.ingest import check_upload, detect_format, read_frame, score_csv_stream
+from app.Utils.batching import MicroBatcher, QueueFullError
+from app.Utils.cache import PredictionCache
+from app.Utils.calibration import load_threshold
+from app.Utils.drift import DriftMonitor, load_reference
+from app.Utils.events import OFF_THRESHOLD, EventDetector
+from app.Utils.live import AlertBus, LiveDetector, source_from_spec
+from app.Utils.model_registry import get_model, get_compiled_model, get_model_version
+from app.Utils.instrumentation import format_metric, render_prometheus, stage
+
+# Chosen by python -m app.Utils.calibration for the current model, else 0.45
+THRESHOLD = load_threshold(get_model_version())
+
+# "sklearn" scores with the joblib VotingClassifier, "compiled" with the
+# NumPy-only CompiledEnsemble exported from it (same probabilities, less overhead)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "sklearn")
+if MODEL_BACKEND not in ("sklearn", "compiled"):
+    raise ValueError(f"Unknown MODEL_BACKEND: {MODEL_BACKEND}")
+
+
+def get_predictor():
+    return get_compiled_model() if MODEL_BACKEND == "compiled" else get_model()
+
+
+get_predictor()  # load at startup rather than on the first request
+
+# Repeat uploads of the same bytes are answered from here without touching the pool
+prediction_cache = PredictionCache(
+    maxsize=int(os.getenv("PREDICTION_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("PREDICTION_CACHE_TTL", 3600)),
+)
+
+# CPU-bound work (CSV parsing, feature extraction, inference) runs here so the
+# event loop only ever awaits; the pool size bounds concurrent CPU work.
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", os.cpu_count() or 1))
+executor = ThreadPoolExecutor(max_workers=PREDICT_WORKERS, thread_name_prefix="predict")
+
+# Single-window predictions from concurrent requests share one model call:
+# a batch goes out after BATCH_MAX_DELAY_MS or once BATCH_MAX_ROWS are
+# waiting. Beyond BATCH_MAX_QUEUE waiting rows, requests get a 503.
+batcher = MicroBatcher(
+    get_predictor,  # resolved per batch, so a replaced model file is picked up
+    max_batch=int(os.getenv("BATCH_MAX_ROWS", 64)),
+    max_delay=float(os.getenv("BATCH_MAX_DELAY_MS", 2)) / 1000,
+    max_queue=int(os.getenv("BATCH_MAX_QUEUE", 1024)),
+    executor=executor,
+)
+
+# Every uploaded window and live sample is sketched here and compared with
+# the training-data profile at CME_DRIFT_REFERENCE (see app.Utils.drift);
+# without one, /api/drift reports moments and missing rates only.
+drift_monitor = DriftMonitor(load_reference())
+
+# /api/timeline answers with every window, so its size is capped
+TIMELINE_MAX_WINDOWS = int(os.getenv("TIMELINE_MAX_WINDOWS", 100_000))
+
+# Live feed scored once per process and pushed to every /api/live/stream
+# client, e.g. LIVE_SOURCE=watch:/data/swis or listen:127.0.0.1:9000 (see
+# app.Utils.live). Unset, the live endpoints answer 503. Every worker process
+# would run its own loop (a listen: source binds in only one of them, other
+# sources are scored once per worker and each worker's clients see a
+# different stream), so a live source needs a single worker.
+LIVE_SOURCE = os.getenv("LIVE_SOURCE")
+if LIVE_SOURCE and int(os.getenv("WEB_CONCURRENCY", 1)) > 1:
+    raise ValueError("LIVE_SOURCE needs a single worker: unset WEB_CONCURRENCY, or serve the live feed "
+                     "from a separate one-worker instance.")
+LIVE_WINDOW = os.getenv("LIVE_WINDOW", "3h")
+LIVE_SPEEDUP = float(os.getenv("LIVE_SPEEDUP", 60))  # for replay: sources
+LIVE_KEEPALIVE = float(os.getenv("LIVE_KEEPALIVE", 15))
+live_bus = AlertBus()
+live_detector = LiveDetector(get_predictor, window=LIVE_WINDOW, threshold=THRESHOLD, bus=live_bus,
+                             monitor=drift_monitor)
+
+
+def live_task_done(task: asyncio.Task):
+    # A failed source would otherwise end the loop silently; run() has
+    # already recorded the error for /api/live and told connected clients
+    if task.cancelled() or task.exception() is None:
+        return
+    print(f"Live detector stopped: {live_detector.error}", flush=True)
+    traceback.print_exception(task.exception())
+
+
+live_task = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global live_task
+    if LIVE_SOURCE:
+        live_task = asyncio.create_task(live_detector.run(source_from_spec(LIVE_SOURCE, LIVE_SPEEDUP)))
+        live_task.add_done_callback(live_task_done)
+    yield
+    if live_task is not None:
+        live_task.cancel()
+    await batcher.close()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
+app.mount("/static", StaticFiles(directory="static"), name="static")
+templates = Jinja2Templates(directory="app/templates")
+
+
+async def run_in_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def cached_predict(contents: bytes, fmt: str = "csv") -> dict:
+    """Returns the prediction for an upload, from the cache when the same bytes were seen before."""
+    key = PredictionCache.make_key(contents, f"{get_model_version()}:{MODEL_BACKEND}", THRESHOLD)
+    prediction = prediction_cache.get(key)
+    if prediction is None:
+        df, features_df = await run_in_pool(features_from_bytes, contents, fmt)
+        prob = await batcher.submit(features_df)
+        prediction = prediction_result(df, features_df, prob)
+        prediction_cache.put(key, prediction)
+    return prediction
+
+
+def features_from_bytes(contents: bytes, fmt: str = "csv"):
+    """
+    Parses an uploaded CSV (or Parquet/Feather file, per `fmt`), validates
+    it and extracts its features. Returns the frame and the 1-row features.
+    Blocking; call it through run_in_pool from request handlers.
+    """
+    # Columns, numeric values and cadence are checked from the first rows;
+    # prepare_window parses, sorts and resamples the whole file once
+    check_upload(contents, fmt)
+    df = read_frame(BytesIO(contents), fmt)
+
+    # Feature extraction; the per-sample features also feed the drift monitor
+    samples = compute_feature_columns(prepare_window(df))
+    drift_monitor.update(samples)
+    features_df = window_feature_means(samples)
+    if features_df.isnull().values.any():
+        raise ValueError("Feature extraction failed. Ensure enough valid data is present (~15 min).")
+    return df, features_df
+
+
+def prediction_result(df: pd.DataFrame, features_df: pd.DataFrame, prob: float) -> dict:
+    """Builds the /predict response from the parsed upload, its features and its probability."""
+    prediction = int(prob >= THRESHOLD)
+    return {
+        "result": "CME" if prediction else "Non-CME",
+        "probability": prob,
+        "confidence": round(prob * 100, 2),
+        "threshold": THRESHOLD,
+        "features": {name: float(value) for name, value in features_df.iloc[0].items()},
+        "preview": df.head(5),
+    }
+
+
+def predict_batch_from_files(uploads: list, label_col: str) -> list:
+    """
+    Parses many uploaded files and scores all their windows with one model
+    call. A file that cannot be read or fails check_upload becomes a single
+    window carrying the error, so only that file fails.
+    """
+    windows, failed, labels = {}, {}, []
+    for filename, contents in uploads:
+        try:
+            fmt = detect_format(filename)
+            check_upload(contents, fmt)
+            df = read_frame(BytesIO(contents), fmt)
+        except ValueError as e:
+            failed[filename] = str(e)
+            labels.append(filename)
+            continue
+        if label_col in df.columns:
+            for label, window in split_labeled_windows(df, label_col).items():
+                windows[f"{filename}:{label}"] = window
+                labels.append(f"{filename}:{label}")
+        else:
+            windows[filename] = df
+            labels.append(filename)
+
+    results = predict_batch(get_predictor(), windows, threshold=THRESHOLD) if windows else None
+    out = []
+    for label in labels:
+        if label in failed:
+            out.append({"window": label, "probability": None, "result": None, "error": failed[label]})
+            continue
+        row = results.loc[label]
+        out.append({
+            "window": label,
+            "probability": None if pd.isna(row["probability"]) else float(row["probability"]),
+            "result": None if row["error"] else ("CME" if row["cme"] else "Non-CME"),
+            "error": row["error"],
+        })
+    return out
+
+
+def timeline_from_file(fileobj, fmt: str, window: str, stride: str):
+    """
+    Scores an uploaded file chunk by chunk, straight from the spooled upload
+    on disk. Returns the per-window probabilities and the detected events.
+
+    The file is never held in memory whole, but the response is: it grows
+    with the number of windows, so strides finer than the 5-minute cadence
+    and timelines of more than TIMELINE_MAX_WINDOWS windows are refused
+    with ValueError.
+    """
+    window, stride = pd.Timedelta(window), pd.Timedelta(stride)
+    if window <= pd.Timedelta(0):
+        raise ValueError("The window length must be positive.")
+    if stride.value < CADENCE_NS:
+        raise ValueError("The stride must be at least 5 minutes, the data cadence.")
+    check_upload(fileobj, fmt)
+    windows = []
+    detector = EventDetector(on=THRESHOLD, off=min(OFF_THRESHOLD, THRESHOLD))
+    events = []
+    for timeline in score_csv_stream(get_predictor(), fileobj, window=window, stride=stride,
+                                     threshold=THRESHOLD, fmt=fmt):
+        if len(windows) + len(timeline) > TIMELINE_MAX_WINDOWS:
+            raise ValueError(f"The timeline would exceed {TIMELINE_MAX_WINDOWS} windows; "
+                             "use a longer stride or a shorter file.")
+        events.append(detector.update(timeline))
+        for row in timeline.itertuples(index=False):
+            windows.append({
+                "window_start": row.window_start.isoformat(),
+                "window_end": row.window_end.isoformat(),
+                "probability": None if pd.isna(row.probability) else float(row.probability),
+                "cme": bool(row.cme),
+            })
+    events.append(detector.finish())
+    return windows, [{
+        "onset": event.onset.isoformat(),
+        "end": event.end.isoformat(),
+        "peak_time": event.peak_time.isoformat(),
+        "peak_probability": float(event.peak_probability),
+        "n_windows": int(event.n_windows),
+    } for frame in events for event in frame.itertuples(index=False)]
+
+
+def format_event(message: dict) -> str:
+    return f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+async def live_events(request: Request):
+    """
+    Yields Server-Sent Events for one client: the latest probability and
+    alert first, then every new message from the shared detector. A comment
+    line goes out after LIVE_KEEPALIVE seconds of silence so proxies keep
+    the connection open.
+    """
+    queue = live_bus.subscribe()
+    try:
+        for message in live_bus.latest.values():
+            yield format_event(message)
+        while not await request.is_disconnected():
+            try:
+                message = await asyncio.wait_for(queue.get(), LIVE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(message)
+    finally:
+        live_bus.unsubscribe(queue)
+
+
+@app.get("/", response_class=HTMLResponse)
+async def home(request: Request):
+    return templates.TemplateResponse(request, "index.html")
+
+@app.post("/predict", response_class=HTMLResponse)
+async def predict(request: Request, file: UploadFile = File(...)):
+    try:
+        contents = await file.read()
+        prediction = await cached_predict(contents, detect_format(file.filename))
+
+        # Pass preview rows (first 5 rows)
+        preview_rows = prediction["preview"]
+
+        with stage("render"):
+            return templates.TemplateResponse(request, "index.html", {
+                "request": request,
+                "submitted": True,
+                "result": prediction["result"],
+                "confidence": prediction["confidence"],
+                "preview_rows": preview_rows.to_html(classes="preview-table", index=False, border=0, escape=False)
+            })
+
+    except Exception as e:
+        return templates.TemplateResponse(request, "index.html", {
+            "request": request,
+            "submitted": True,
+            "error": str(e)
+        })
+
+@app.post("/api/predict")
+async def predict_json(file: UploadFile = File(...)):
+    """JSON counterpart of /predict for programmatic clients."""
+    contents = await file.read()
+    try:
+        prediction = await cached_predict(contents, detect_format(file.filename))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {name: value for name, value in prediction.items() if name != "preview"}
+
+@app.post("/predict/batch")
+async def predict_batch_endpoint(files: List[UploadFile] = File(...), label_col: str = "window_id"):
+    """
+    Scores many uploads in one model call. Each file is one window, unless it
+    has a `label_col` column, in which case it is split into labelled windows.
+    """
+    uploads = [(file.filename, await file.read()) for file in files]
+    try:
+        results = await run_in_pool(predict_batch_from_files, uploads, label_col)
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": results}
+
+@app.post("/api/timeline")
+async def timeline_endpoint(file: UploadFile = File(...), window: str = "3h", stride: str = "5min"):
+    """
+    Per-window CME probabilities for a long upload, plus the CME events
+    found in them (onset, end and peak of each run above THRESHOLD). The
+    file is read in chunks; the stride must be at least 5 minutes and the
+    timeline at most TIMELINE_MAX_WINDOWS windows long.
+    """
+    try:
+        windows, events = await run_in_pool(timeline_from_file, file.file, detect_format(file.filename), window, stride)
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"threshold": THRESHOLD, "window": window, "stride": stride, "windows": windows, "events": events}
+
+@app.get("/api/live/stream")
+async def live_stream(request: Request):
+    """
+    Pushes live CME probabilities ("probability" events, one per 5-minute
+    bin) and threshold crossings ("alert" events) as Server-Sent Events.
+    All clients share one scoring loop; connecting does not run the model.
+    """
+    if not LIVE_SOURCE:
+        raise HTTPException(status_code=503, detail="No live source configured (set LIVE_SOURCE).")
+    if live_detector.error:
+        raise HTTPException(status_code=503, detail=f"Live source failed: {live_detector.error}")
+    return StreamingResponse(live_events(request), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/live/latest")
+async def live_latest():
+    """
+    Latest live probability and alert, for clients that poll instead of
+    streaming, plus whether the live loop is still running and why it
+    failed if it did.
+    """
+    if not LIVE_SOURCE:
+        raise HTTPException(status_code=503, detail="No live source configured (set LIVE_SOURCE).")
+    return {"threshold": THRESHOLD, "window": LIVE_WINDOW, "running": live_task is not None and not live_task.done(),
+            **live_bus.latest}
+
+@app.get("/api/drift")
+async def drift_scores():
+    """
+    Drift of the inputs seen since startup (uploads and live samples)
+    against the training reference: per-column PSI, mean shift in reference
+    standard deviations and missing rates, plus the columns over the PSI limit.
+    """
+    return {"reference": drift_monitor.reference is not None, **drift_monitor.scores()}
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint: per-stage timings, row counts and (with
+    PIPELINE_METRICS=memory) allocations, plus prediction cache counters
+    and input drift gauges.
+    Stages are only recorded when PIPELINE_METRICS is "on" or "memory".
+    """
+    drift_columns = drift_monitor.scores()["columns"]
+    body = render_prometheus() + "".join([
+        format_metric("cme_prediction_cache_hits_total", "counter",
+                      "Predictions answered from the cache.", prediction_cache.hits),
+        format_metric("cme_prediction_cache_misses_total", "counter",
+                      "Predictions that ran the pipeline.", prediction_cache.misses),
+        format_metric("cme_prediction_cache_entries", "gauge",
+                      "Predictions currently cached.", len(prediction_cache)),
+        format_metric("cme_inference_batches_total", "counter",
+                      "Micro-batched model calls for single-window predictions.", batcher.batches),
+        format_metric("cme_inference_batched_rows_total", "counter",
+                      "Windows scored through the micro-batcher.", batcher.rows),
+        format_metric("cme_inference_rejected_total", "counter",
+                      "Predictions refused because the batch queue was full.", batcher.rejected),
+        format_metric("cme_inference_queue_depth", "gauge",
+                      "Windows waiting for the next batch.", len(batcher)),
+        format_metric("cme_live_records_total", "counter",
+                      "Live samples read from LIVE_SOURCE.", live_detector.records),
+        format_metric("cme_live_scores_total", "counter",
+                      "Live windows scored.", live_detector.scores),
+        format_metric("cme_live_up", "gauge",
+                      "1 while the live detector loop is running.", int(live_task is not None and not live_task.done())),
+        format_metric("cme_live_subscribers", "gauge",
+                      "Clients connected to /api/live/stream.", len(live_bus)),
+        format_metric("cme_drift_psi", "gauge",
+                      "Population stability index of each input column against the training reference.",
+                      {f'column="{col}"': entry["psi"] for col, entry in drift_columns.items()
+                       if entry["psi"] is not None}),
+        format_metric("cme_drift_mean_shift", "gauge",
+                      "Shift of each input column's mean, in reference standard deviations.",
+                      {f'column="{col}"': entry["mean_shift"] for col, entry in drift_columns.items()
+                       if entry["mean_shift"] is not None}),
+        format_metric("cme_input_missing_ratio", "gauge",
+                      "Share of missing or non-finite values in each input column.",
+                      {f'column="{col}"': entry["missing_rate"] for col, entry in drift_columns.items()
+                       if entry["missing_rate"] is not None}),
+    ])
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
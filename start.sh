@@ -1 +1,8 @@
-uvicorn main:app --host=0.0.0.0 --port=10000
+WORKERS=${WEB_CONCURRENCY:-1}
+
+if [ "$WORKERS" -gt 1 ]; then
+  # Pre-fork mode: the model is loaded once here and the forked workers share it
+  exec python -m app.Utils.prefork main:app --host=0.0.0.0 --port=10000 --workers "$WORKERS"
+fi
+
+exec uvicorn main:app --host=0.0.0.0 --port=10000
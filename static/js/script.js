@@ -28,6 +28,42 @@ document.addEventListener("DOMContentLoaded", function () {
       submitButton.textContent = "Predicting...";
     }
   });
-});
 
+  // Live probabilities pushed by the server; the panel stays hidden when
+  // no live source is configured (the stream answers 503 and is closed)
+  const live = document.getElementById("live");
+  if (live && window.EventSource) {
+    const stream = new EventSource("/api/live/stream");
+
+    stream.addEventListener("probability", function (event) {
+      const message = JSON.parse(event.data);
+      const percent = message.probability === null ? 0 : Math.round(message.probability * 1000) / 10;
+      live.style.display = "block";
+      document.getElementById("live-probability").textContent =
+        message.probability === null ? "not enough data" : percent + "%";
+      document.getElementById("live-time").textContent = message.timestamp;
+      document.getElementById("live-bar").style.setProperty("--percent", percent + "%");
+    });
+
+    stream.addEventListener("alert", function (event) {
+      const message = JSON.parse(event.data);
+      const onset = message.event === "cme_onset";
+      live.style.display = "block";
+      live.classList.toggle("alert", onset);
+      document.getElementById("live-alert").textContent =
+        (onset ? "⚠️ CME signature since " : "CME signature ended at ") + message.timestamp;
+    });
 
+    stream.addEventListener("source_error", function (event) {
+      const message = JSON.parse(event.data);
+      live.style.display = "block";
+      document.getElementById("live-alert").textContent = "Live feed stopped: " + message.error;
+    });
+
+    stream.addEventListener("error", function () {
+      if (stream.readyState === EventSource.CLOSED) {
+        live.style.display = "none";
+      }
+    });
+  }
+});
@@ -1,17 +1,140 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import joblib
-from app.Utils.features import extract_features_from_window
+import hashlib
+import os
+from contextlib import ExitStack
+from datetime import timedelta
+from app.Utils.features import (
+    compute_feature_columns, prepare_window, sample_window_features, window_feature_means,
+)
+from app.Utils.inference import score_windows
+from app.Utils.events import OFF_THRESHOLD, detect_events
+from app.Utils.decimate import decimate_frame
+from app.Utils.cache import PredictionCache
+from app.Utils.calibration import load_threshold
+from app.Utils.model_registry import get_model, get_model_version
+from app.Utils.ingest import check_upload, detect_format, read_frame
+from app.Utils.instrumentation import stage, trace
 import plotly.graph_objects as go
 import plotly.express as px
+from plotly.subplots import make_subplots
 
 # ==========================
 # Load Model
 # ==========================
 MODEL_PATH = "app/model/cme_model.joblib"
-model = joblib.load(MODEL_PATH)
-THRESHOLD = 0.45
+# Loaded once per process and shared by every rerun and session
+model = get_model(MODEL_PATH)
+MODEL_VERSION = get_model_version(MODEL_PATH)
+# Chosen by python -m app.Utils.calibration for this model, else 0.45
+THRESHOLD = load_threshold(MODEL_VERSION)
+
+STAGE_CACHE_MB = int(os.getenv("STAGE_CACHE_MB", 512))
+
+@st.cache_resource
+def get_stage_cache():
+    # Each upload's parsed frame, 5-minute samples, prediction and timeline,
+    # shared by every session so reruns and re-uploads skip the pipeline.
+    # Least recently used entries go once the cache holds STAGE_CACHE_MB.
+    return PredictionCache(maxsize=256, ttl=3600, max_bytes=STAGE_CACHE_MB * 2**20)
+
+stage_cache = get_stage_cache()
+computed_stages = []  # stages this run had to compute, for the debug panel
+
+def upload_digest(uploaded_file):
+    # Hashing a large upload costs more than a rerun should, so each upload is hashed once per session
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return digests[uploaded_file.file_id]
+
+def parse_upload(uploaded_file, fmt: str) -> pd.DataFrame:
+    # A malformed file is rejected from its first rows, before the full parse
+    check_upload(uploaded_file, fmt)
+    return read_frame(uploaded_file, fmt)
+
+def memoized(key, name, compute):
+    # Cached values are shared across sessions: treat them as read-only
+    value = stage_cache.get(key)
+    if value is None:
+        value = compute()
+        stage_cache.put(key, value)
+        computed_stages.append(name)
+    return value
+
+def predict_samples(samples):
+    features_df = window_feature_means(samples)
+    with stage("inference", 1):
+        prob = None if features_df.isnull().values.any() else model.predict_proba(features_df)[0][1]
+    return features_df, prob
+
+def score_samples(samples):
+    timeline = score_windows(model, sample_window_features(samples, window="3h"), THRESHOLD)
+    events = detect_events(timeline, on=THRESHOLD, off=min(OFF_THRESHOLD, THRESHOLD))
+    timeline["timestamp"] = timeline["window_start"] + (timeline["window_end"] - timeline["window_start"]) / 2
+    return timeline, events
+
+def show_pipeline_timings(records, computed):
+    # Debug panel: where this upload's time went, stage by stage
+    with st.expander("🛠️ Pipeline Timings", expanded=True):
+        if computed:
+            st.caption(f"Computed this run: {', '.join(computed)}. Everything else came from the stage cache.")
+        else:
+            st.caption("Every stage was served from the stage cache; only rendering ran.")
+        if not records:
+            st.info("No stages were recorded.")
+            return
+        timings = pd.DataFrame(records).sort_values("started")
+        total_ms = ((timings["started"] + timings["ms"] / 1000).max() - timings["started"].min()) * 1000
+        timings = timings.drop(columns="started").dropna(axis=1, how="all")
+        st.dataframe(timings, use_container_width=True, hide_index=True)
+        st.caption(f"Wall time across stages: {total_ms:.1f} ms. Nested stages (rolling_std inside features) "
+                   "are included in their parent's time.")
+
+SERIES_PANELS = [("Np", "Np (cm⁻³)"), ("Vp", "Vp (km/s)"), ("Tp", "Tp"), ("Alpha", "Alpha (cm⁻³)")]
+
+def show_time_series(digest, samples):
+    # Plots are min/max-decimated to a fixed number of points per trace, so
+    # weeks of data stay responsive; moving the range slider re-decimates
+    # the selected span, which is how zooming reaches full resolution
+    if len(samples) < 2:
+        st.info("Not enough samples to plot a time series.")
+        return
+
+    model_key = f"{MODEL_VERSION}:{THRESHOLD!r}"
+    timeline, events = memoized(f"{digest}:timeline:{model_key}", "timeline", lambda: score_samples(samples))
+
+    first, last = samples["timestamp"].iloc[0].to_pydatetime(), samples["timestamp"].iloc[-1].to_pydatetime()
+    start, end = st.slider("Time range", min_value=first, max_value=last, value=(first, last),
+                           step=timedelta(minutes=5), format="YYYY-MM-DD HH:mm")
+
+    def decimate():
+        with stage("decimate", len(samples)):
+            return (decimate_frame(samples, [col for col, _ in SERIES_PANELS], start=start, end=end),
+                    decimate_frame(timeline, ["probability"], start=start, end=end))
+    series, probability = memoized(f"{digest}:view:{model_key}:{start}:{end}", "decimate", decimate)
+
+    fig = make_subplots(rows=len(SERIES_PANELS) + 1, cols=1, shared_xaxes=True, vertical_spacing=0.02,
+                        subplot_titles=[label for _, label in SERIES_PANELS] + ["CME probability (3h windows)"])
+    for row, (col, label) in enumerate(SERIES_PANELS, start=1):
+        fig.add_trace(go.Scattergl(x=series["timestamp"], y=series[col], mode="lines", name=label,
+                                   line=dict(width=1, color="#64b5f6")), row=row, col=1)
+    fig.add_trace(go.Scattergl(x=probability["timestamp"], y=probability["probability"], mode="lines",
+                               name="Probability", line=dict(width=1.5, color="#ff7043")),
+                  row=len(SERIES_PANELS) + 1, col=1)
+    fig.add_hline(y=THRESHOLD, line=dict(color="yellow", dash="dash", width=1), row=len(SERIES_PANELS) + 1, col=1)
+    for event in events.itertuples(index=False):
+        if event.end >= pd.Timestamp(start) and event.onset <= pd.Timestamp(end):
+            fig.add_vrect(x0=event.onset, x1=event.end, fillcolor="red", opacity=0.15, line_width=0, row="all", col=1)
+
+    fig.update_layout(height=180 * (len(SERIES_PANELS) + 1), showlegend=False, paper_bgcolor="rgba(0,0,0,0)",
+                      plot_bgcolor="rgba(30,30,30,0.5)", font={'color': "white"}, margin=dict(t=40, b=20))
+    with stage("render"):
+        st.plotly_chart(fig, use_container_width=True)
+    in_range = samples["timestamp"].between(pd.Timestamp(start), pd.Timestamp(end)).sum()
+    st.caption(f"{in_range:,} 5-minute samples in range, drawn with at most {len(series):,} points per trace. "
+               f"Shaded spans are detected CME events ({len(events)} in the file).")
 
 # ==========================
 # Custom CSS for Enhanced UI
@@ -111,6 +234,10 @@ page = st.sidebar.radio(
     label_visibility="collapsed"
 )
 
+debug_panel = st.sidebar.checkbox("🛠️ Pipeline debug panel", help="Time each stage of the prediction pipeline")
+debug_memory = debug_panel and st.sidebar.checkbox("Track memory (slower)",
+                                                   help="Record allocations per stage with tracemalloc")
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("""
 <div style='text-align: center; padding: 20px;'>
@@ -152,16 +279,21 @@ if page == "🔮 Prediction Interface":
     st.markdown("### 📁 Upload Solar Wind Data")
     uploaded_file = st.file_uploader(
         "Select your CSV file containing plasma parameters",
-        type=["csv"],
+        type=["csv", "parquet", "feather", "arrow"],
         help="File should contain: proton_density, proton_speed, proton_temperature, alpha_density"
     )
 
     if uploaded_file is not None:
+        debug_trace = ExitStack()
+        stage_records = debug_trace.enter_context(trace(memory=debug_memory)) if debug_panel else None
         try:
-            df = pd.read_csv(uploaded_file)
+            digest = upload_digest(uploaded_file)
+            fmt = detect_format(uploaded_file.name)
+            df = memoized(f"{digest}:frame", "parse", lambda: parse_upload(uploaded_file, fmt))
             
             # Create tabs for better organization
-            tab1, tab2, tab3 = st.tabs(["📊 Data Preview", "🔮 Prediction Results", "📈 Feature Analysis"])
+            tab1, tab2, tab3, tab4 = st.tabs(["📊 Data Preview", "🔮 Prediction Results", "📈 Feature Analysis",
+                                              "🕒 Time Series"])
             
             with tab1:
                 st.markdown("#### Uploaded Dataset")
@@ -177,12 +309,14 @@ if page == "🔮 Prediction Interface":
             if not required_cols.issubset(df.columns):
                 st.error(f"❌ Missing required columns: {required_cols - set(df.columns)}")
             else:
-                features_df = extract_features_from_window(df)
+                samples = memoized(f"{digest}:samples", "resample+features",
+                                   lambda: compute_feature_columns(prepare_window(df)))
+                features_df, prob = memoized(f"{digest}:prediction:{MODEL_VERSION}:{THRESHOLD!r}", "inference",
+                                             lambda: predict_samples(samples))
 
-                if features_df.isnull().values.any():
+                if prob is None:
                     st.error("❌ Not enough valid data available for feature computation (~15 min needed).")
                 else:
-                    prob = model.predict_proba(features_df)[0][1]
                     prediction = "CME" if prob >= THRESHOLD else "Non-CME"
                     
                     with tab2:
@@ -220,7 +354,8 @@ if page == "🔮 Prediction Interface":
                             height=400
                         )
                         
-                        st.plotly_chart(fig, use_container_width=True)
+                        with stage("render"):
+                            st.plotly_chart(fig, use_container_width=True)
                         
                         # Result display
                         st.markdown("<br>", unsafe_allow_html=True)
@@ -277,7 +412,8 @@ if page == "🔮 Prediction Interface":
                             height=400
                         )
                         
-                        st.plotly_chart(fig_features, use_container_width=True)
+                        with stage("render"):
+                            st.plotly_chart(fig_features, use_container_width=True)
                         
                         # Feature descriptions
                         with st.expander("📖 Feature Descriptions"):
@@ -290,9 +426,18 @@ if page == "🔮 Prediction Interface":
                             | **Alpha/Temperature Ratio** | Detects cool, dense CME material |
                             """)
 
+                with tab4:
+                    st.markdown("### 🕒 Plasma Time Series")
+                    show_time_series(digest, samples)
+
         except Exception as e:
             st.error(f"⚠️ Error processing file: {str(e)}")
             st.info("Please ensure your CSV file contains the required columns with valid numerical data.")
+        finally:
+            debug_trace.close()
+
+        if stage_records is not None:
+            show_pipeline_timings(stage_records, computed_stages)
 
     else:
         # Landing state with instructions
@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+fastapi_testclient = pytest.importorskip("fastapi.testclient")
+main = pytest.importorskip("main")
+
+with open("debug_input.csv", "rb") as f:
+    GOOD = f.read()
+
+
+@pytest.fixture(scope="module")
+def client():
+    with fastapi_testclient.TestClient(main.app) as c:
+        yield c
+
+
+def test_batch_reports_bad_files_per_window(client):
+    sparse = pd.read_csv("debug_input.csv")
+    sparse["timestamp"] = pd.date_range("2024-05-10", periods=len(sparse), freq="1h")
+    files = [("files", ("good.csv", GOOD, "text/csv")),
+             ("files", ("bad.csv", b"a,b\n1,2\n", "text/csv")),
+             ("files", ("sparse.csv", sparse.to_csv(index=False).encode(), "text/csv"))]
+
+    response = client.post("/predict/batch", files=files)
+
+    assert response.status_code == 200
+    results = {row["window"]: row for row in response.json()["results"]}
+    assert list(results) == ["good.csv", "bad.csv", "sparse.csv"]
+    assert results["good.csv"]["error"] is None and results["good.csv"]["probability"] is not None
+    assert "columns" in results["bad.csv"]["error"] and results["bad.csv"]["probability"] is None
+    assert "too sparse" in results["sparse.csv"]["error"]
+
+
+@pytest.mark.parametrize("params", [{"stride": "1s"}, {"stride": "1ns"}, {"window": "0s"}, {"stride": "soon"}])
+def test_timeline_rejects_unbounded_requests(client, params):
+    response = client.post("/api/timeline", params=params, files={"file": ("a.csv", GOOD, "text/csv")})
+    assert response.status_code == 400
+
+
+def test_timeline_caps_window_count(client, monkeypatch):
+    monkeypatch.setattr(main, "TIMELINE_MAX_WINDOWS", 100)
+    response = client.post("/api/timeline", files={"file": ("a.csv", GOOD, "text/csv")})
+    assert response.status_code == 400
+    assert "100 windows" in response.json()["detail"]
+
+    monkeypatch.setattr(main, "TIMELINE_MAX_WINDOWS", 10_000)
+    response = client.post("/api/timeline", files={"file": ("a.csv", GOOD, "text/csv")})
+    assert response.status_code == 200
+    assert len(response.json()["windows"]) > 100
+
+
+def test_full_batch_queue_answers_503(client, monkeypatch):
+    async def refuse(features):
+        raise main.QueueFullError("Prediction queue is full (0 waiting); retry shortly.")
+
+    monkeypatch.setattr(main.batcher, "submit", refuse)
+    main.prediction_cache.clear()
+    response = client.post("/api/predict", files={"file": ("a.csv", GOOD, "text/csv")})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_mixed_utc_offsets_are_scored(client):
+    df = pd.read_csv("debug_input.csv")
+    utc = pd.to_datetime(df["timestamp"]).dt.tz_localize("UTC")
+    df["timestamp"] = [t.tz_convert("Asia/Kolkata").isoformat() if i % 2 else t.strftime("%Y-%m-%dT%H:%M:%SZ")
+                       for i, t in enumerate(utc)]
+
+    response = client.post("/api/predict", files={"file": ("mixed.csv", df.to_csv(index=False).encode(), "text/csv")})
+
+    assert response.status_code == 200
+    expected = client.post("/api/predict", files={"file": ("a.csv", GOOD, "text/csv")}).json()
+    assert response.json()["confidence"] == expected["confidence"]
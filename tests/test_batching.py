@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+import numpy as np
+import pytest
+from app.Utils.batching import MicroBatcher, QueueFullError
+from app.Utils.features import FEATURE_COLUMNS
+
+
+class RowSumModel:
+    """Scores a row as the sum of its features, recording each batch size."""
+
+    def __init__(self, delay: float = 0.0, gate: threading.Event = None):
+        self.delay = delay
+        self.gate = gate
+        self.batch_sizes = []
+
+    def predict_proba(self, X):
+        if self.gate is not None:
+            self.gate.wait(5)
+        time.sleep(self.delay)
+        self.batch_sizes.append(len(X))
+        p = X[FEATURE_COLUMNS].to_numpy().sum(axis=1)
+        return np.column_stack([1 - p, p])
+
+
+def rows(n):
+    return [np.full(len(FEATURE_COLUMNS), i / 100) for i in range(n)]
+
+
+def test_concurrent_submits_share_model_calls():
+    model = RowSumModel(delay=0.02)
+
+    async def run():
+        batcher = MicroBatcher(model, max_batch=16, max_delay=0.01)
+        try:
+            return await asyncio.gather(*(batcher.submit(row) for row in rows(40))), batcher
+        finally:
+            await batcher.close()
+
+    results, batcher = asyncio.run(run())
+
+    np.testing.assert_allclose(results, [row.sum() for row in rows(40)])
+    assert sum(model.batch_sizes) == batcher.rows == 40
+    assert batcher.batches == len(model.batch_sizes) < 40
+    assert max(model.batch_sizes) <= 16
+
+
+def test_lone_request_is_not_delayed():
+    model = RowSumModel()
+
+    async def run():
+        batcher = MicroBatcher(model, max_delay=1.0)
+        try:
+            start = time.perf_counter()
+            await batcher.submit(rows(1)[0])
+            return time.perf_counter() - start
+        finally:
+            await batcher.close()
+
+    assert asyncio.run(run()) < 0.5
+    assert model.batch_sizes == [1]
+
+
+def test_full_queue_refuses_submits():
+    gate = threading.Event()
+    model = RowSumModel(gate=gate)
+
+    async def run():
+        batcher = MicroBatcher(model, max_batch=4, max_delay=0, max_queue=2)
+        try:
+            first = asyncio.create_task(batcher.submit(rows(1)[0]))
+            await asyncio.sleep(0.01)  # the first row leaves the queue and blocks in the model
+            assert len(batcher) == 0
+            queued = [asyncio.create_task(batcher.submit(row)) for row in rows(2)]
+            await asyncio.sleep(0.01)
+            with pytest.raises(QueueFullError):
+                await batcher.submit(rows(1)[0])
+            gate.set()
+            return await asyncio.gather(first, *queued), batcher.rejected
+        finally:
+            gate.set()
+            await batcher.close()
+
+    results, rejected = asyncio.run(run())
+
+    assert rejected == 1
+    np.testing.assert_allclose(results, [0.0, 0.0, 0.04])
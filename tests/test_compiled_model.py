@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.Utils.compiled_model import CompiledEnsemble, compile_ensemble
+
+joblib = pytest.importorskip("joblib")
+pytest.importorskip("xgboost")
+
+MODEL_PATH = "app/model/cme_model.joblib"
+
+
+@pytest.fixture(scope="module")
+def model():
+    return joblib.load(MODEL_PATH)
+
+
+def seeded_rows(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        "alpha_proton_ratio": rng.uniform(0, 0.2, n),
+        "vp_std_15min": rng.lognormal(1, 1.5, n),
+        "alpha_tp_ratio": rng.uniform(0, 5e-6, n),
+    })
+    X["alpha_over_vpstd"] = X["alpha_proton_ratio"] / X["vp_std_15min"]
+    return X[CompiledEnsemble.feature_names]
+
+
+def test_compiled_ensemble_matches_voting_classifier(model):
+    X = seeded_rows()
+
+    expected = model.predict_proba(X)
+    result = compile_ensemble(model).predict_proba(X)
+
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, rtol=0, atol=5e-8)
+
+
+def test_compiled_ensemble_survives_save_dir(model, tmp_path):
+    X = seeded_rows(200, seed=1)
+    compiled = compile_ensemble(model)
+
+    compiled.save_dir(tmp_path)
+    loaded = CompiledEnsemble.load_dir(tmp_path)
+
+    np.testing.assert_array_equal(loaded.predict_proba(X), compiled.predict_proba(X))
+    np.testing.assert_array_equal(loaded.predict_proba(X.to_numpy()[0]), compiled.predict_proba(X.iloc[:1]))
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.Utils.events import detect_events
+
+
+def timeline(p, start="2024-05-10", tz=None):
+    starts = pd.date_range(start, periods=len(p), freq="5min", tz=tz)
+    return pd.DataFrame({"window_start": starts, "window_end": starts + pd.Timedelta("3h"),
+                         "probability": np.asarray(p, dtype="float64")})
+
+
+def noisy_probabilities(n=3000, seed=0):
+    # A slow random walk crosses both thresholds many times, with gaps of missing windows
+    rng = np.random.default_rng(seed)
+    p = np.clip(0.4 + np.cumsum(rng.normal(0, 0.03, n)) % 0.6 - 0.1, 0, 1)
+    p[rng.integers(0, n, 40)] = np.nan
+    return p
+
+
+def test_detect_events_applies_hysteresis_merge_and_min_duration():
+    p = [0.1] * 3 + [0.5, 0.4, 0.4, 0.6, 0.4, 0.4] + [0.1] * 4 + [0.5, 0.5] + [0.1] * 30 + [0.9] + [0.1] * 3
+    events = detect_events(timeline(p), min_duration="30min", merge_gap="30min")
+
+    # The first run (windows 3-8) and the one 25 min later merge; the lone 0.9 is too short
+    assert len(events) == 1
+    event = events.iloc[0]
+    mid = pd.Timestamp("2024-05-10") + pd.Timedelta("90min")
+    assert event["onset"] == mid + 3 * pd.Timedelta("5min")
+    assert event["end"] == mid + 14 * pd.Timedelta("5min")
+    assert event["peak_time"] == mid + 6 * pd.Timedelta("5min")
+    assert event["peak_probability"] == 0.6
+    assert event["n_windows"] == 8
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 250, 2999])
+def test_chunked_detection_matches_whole_timeline(chunk):
+    whole = timeline(noisy_probabilities())
+    expected = detect_events(whole)
+    assert len(expected) > 5
+
+    chunks = (whole.iloc[i:i + chunk] for i in range(0, len(whole), chunk))
+    result = detect_events(chunks)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_events_keep_the_timeline_time_zone():
+    whole = timeline(noisy_probabilities(500, seed=1), tz="Asia/Kolkata")
+    events = detect_events(whole.iloc[i:i + 40] for i in range(0, len(whole), 40))
+
+    assert len(events)
+    assert str(events["onset"].dt.tz) == "Asia/Kolkata"
+    assert events["onset"].min() >= whole["window_start"].min()
@@ -0,0 +1,37 @@
+import os
+import pandas as pd
+import pytest
+from app.Utils.benchmark import synthetic_swis
+from app.Utils.feature_store import FeatureStore
+from app.Utils.ingest import iter_feature_samples, iter_resampled_chunks, read_chunks
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / "swis.csv"
+    synthetic_swis(4000, "1min", start="2025-06-14 20:00:00").to_csv(path, index=False)
+    store = FeatureStore(str(tmp_path / "store"))
+    store.ingest(str(path))
+    return store, str(path)
+
+
+def test_interrupted_write_keeps_stored_days(store):
+    store, path = store
+    before = store.read()
+    assert len(store.days()) == 4
+
+    def failing_samples():
+        for frame in iter_feature_samples(iter_resampled_chunks(read_chunks(path, "csv", 1000))):
+            yield frame.assign(alpha_tp_ratio=frame["alpha_tp_ratio"] + 1)
+            if frame["timestamp"].iloc[-1] >= pd.Timestamp("2025-06-15 06:00"):
+                raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        store.write(failing_samples())
+
+    # The first day was complete and is replaced; the interrupted second day is untouched
+    after = store.read()
+    first_day = after["timestamp"] < pd.Timestamp("2025-06-15")
+    assert (after.loc[first_day, "alpha_tp_ratio"] == before.loc[first_day, "alpha_tp_ratio"] + 1).all()
+    pd.testing.assert_frame_equal(after[~first_day], before[~first_day])
+    assert not [name for name in os.listdir(store.root) if name.endswith(".tmp")]
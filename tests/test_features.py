@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.Utils.features import CADENCE_NS, extract_features_from_window, prepare_window, rolling_vp_std
+from app.Utils.streaming import StreamingFeatureExtractor
+
+REPEATED = [357.6638450878535] * 3 + [400.1] * 4 + [401.3, 399.7] + [399.7] * 5 + [512.25] * 3
+
+
+def raw_frame(vp):
+    n = len(vp)
+    return pd.DataFrame({
+        "timestamp": pd.date_range("2024-05-10", periods=n, freq="5min"),
+        "proton_density": np.linspace(4.0, 6.0, n),
+        "proton_speed": vp,
+        "proton_temperature": np.linspace(9e4, 1.1e5, n),
+        "alpha_density": np.linspace(0.1, 0.3, n),
+    })
+
+
+@pytest.mark.parametrize("vp", [[357.6638450878535] * 12, REPEATED])
+def test_rolling_vp_std_matches_pandas_on_repeated_values(vp):
+    vp = np.asarray(vp)
+    ts = np.arange(len(vp), dtype="int64") * CADENCE_NS
+    expected = pd.Series(vp).rolling(window=3, center=True).std().to_numpy()
+
+    result = rolling_vp_std(ts, vp)
+
+    np.testing.assert_allclose(result, expected, rtol=1e-9, atol=0)
+    assert (result[np.flatnonzero(expected == 0)] == 0).all()
+
+
+def test_window_features_skip_zero_std_like_baseline():
+    df = raw_frame(REPEATED)
+    baseline = df.rename(columns={"proton_density": "Np", "proton_speed": "Vp",
+                                  "proton_temperature": "Tp", "alpha_density": "Alpha"})
+    baseline["alpha_proton_ratio"] = baseline["Alpha"] / baseline["Np"]
+    baseline["vp_std_15min"] = baseline["Vp"].rolling(window=3, center=True).std()
+    baseline["alpha_over_vpstd"] = baseline["alpha_proton_ratio"] / baseline["vp_std_15min"].replace(0, np.nan)
+    baseline["alpha_tp_ratio"] = baseline["Alpha"] / baseline["Tp"]
+    expected = baseline.dropna()[["alpha_proton_ratio", "vp_std_15min", "alpha_over_vpstd", "alpha_tp_ratio"]].mean()
+
+    result = extract_features_from_window(df.copy())
+    numpy_path = extract_features_from_window({col: df[col].to_numpy() for col in df.columns})
+    streamed = StreamingFeatureExtractor().update_batch(df).features()
+
+    for features in (result, numpy_path, streamed):
+        np.testing.assert_allclose(features.iloc[0].to_numpy(), expected.to_numpy(), rtol=1e-9)
+
+
+def test_prepare_window_tz_aware_file_with_one_bad_timestamp():
+    df = raw_frame(REPEATED)
+    df["timestamp"] = df["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    df.loc[4, "timestamp"] = "not a time"
+
+    prepared = prepare_window(df)
+
+    assert str(prepared["timestamp"].dt.tz) == "UTC"
+    assert len(prepared) == len(df) - 1
+    assert pd.Timestamp("2024-05-10 00:20", tz="UTC") not in set(prepared["timestamp"])
+
+
+def test_prepare_window_mixed_utc_offsets():
+    df = raw_frame(REPEATED)
+    utc = df["timestamp"].dt.tz_localize("UTC")
+    df["timestamp"] = [t.tz_convert("Asia/Kolkata").isoformat() if i % 2 else t.strftime("%Y-%m-%dT%H:%M:%SZ")
+                       for i, t in enumerate(utc)]
+
+    prepared = prepare_window(df)
+
+    assert str(prepared["timestamp"].dt.tz) == "UTC"
+    pd.testing.assert_series_equal(prepared["timestamp"], utc, check_names=False)
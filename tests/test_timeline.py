@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from app.Utils.backfill import backfill
+from app.Utils.benchmark import synthetic_swis
+from app.Utils.inference import score_timeline
+from app.Utils.ingest import read_frame, score_csv_stream
+from app.Utils.model_registry import get_model
+
+
+@pytest.fixture(scope="module")
+def model():
+    return get_model()
+
+
+@pytest.fixture(scope="module")
+def swis_csv(tmp_path_factory):
+    # Four days of 1-minute data with a 10-hour gap, so windows straddle chunk, shard and gap edges
+    df = synthetic_swis(6000, "1min")
+    df = df.drop(df.index[2000:2600])
+    path = tmp_path_factory.mktemp("swis") / "swis.csv"
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def expected(model, swis_csv):
+    return score_timeline(model, read_frame(swis_csv, "csv"), threshold=0.5)
+
+
+@pytest.mark.parametrize("chunksize", [700, 2001, 1_000_000])
+def test_score_csv_stream_matches_score_timeline(model, swis_csv, expected, chunksize):
+    result = pd.concat(score_csv_stream(model, swis_csv, threshold=0.5, chunksize=chunksize), ignore_index=True)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_backfill_matches_score_timeline(swis_csv, expected, tmp_path):
+    merged = backfill([swis_csv], str(tmp_path), shard="1D", threshold=0.5, workers=1)
+    result = pd.read_parquet(merged)
+
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
+
+    # A re-run finds every shard done and rebuilds the same timeline
+    assert pd.read_parquet(backfill([swis_csv], str(tmp_path), shard="1D", threshold=0.5, workers=1)).equals(result)